@@ -0,0 +1,642 @@
+#!/usr/bin/env python3
+"""
+Benchmarks do Xumbr3ga Chat Hub — rodam offline, sem Twitch/Kick/YouTube.
+  python bench.py render     renderização de emotes (com e sem cache)
+  python bench.py irc        parser IRC da Twitch (uma passada vs. substring + regex)
+  python bench.py load       hub completo contra servidores locais que imitam Twitch/Kick/YouTube
+  python bench.py history    backends do histórico (segmentos NDJSON vs. SQLite): gravação, start e consultas
+"""
+import argparse
+import asyncio
+import gc
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import web, ClientSession, ClientTimeout, WSMsgType
+
+import server
+
+
+# ── Corpus ────────────────────────────────────────────────────────────────────
+
+TW_EMOTES = [('25', 'Kappa'), ('305954156', 'PogChamp'), ('1902', 'Keepo'), ('88', 'PogChamp2'), ('86', 'BibleThump')]
+KI_EMOTES = [('37226', 'KEKLEO'), ('39261', 'KEKW'), ('37230', 'POLICE'), ('39265', 'Clap')]
+WORDS = 'kkkk boa gg mano que isso nossa vai caramba pqp salve live hoje top demais rsrs'.split()
+
+
+def _tw_line(rng: random.Random) -> tuple[str, str]:
+    """Mensagem Twitch com a tag `emotes` como o IRC manda (id:ini-fim,ini-fim/...)."""
+    parts, positions, pos = [], {}, 0
+    for _ in range(rng.randint(1, 8)):
+        if rng.random() < 0.5:
+            id_, name = rng.choice(TW_EMOTES)
+            positions.setdefault(id_, []).append(f'{pos}-{pos + len(name) - 1}')
+            word = name
+        else:
+            word = rng.choice(WORDS)
+        parts.append(word)
+        pos += len(word) + 1
+    tag = '/'.join(f'{id_}:{",".join(p)}' for id_, p in positions.items())
+    return ' '.join(parts), tag
+
+
+def _ki_line(rng: random.Random) -> str:
+    """Mensagem Kick com emotes inline no formato [emote:id:nome]."""
+    words = []
+    for _ in range(rng.randint(1, 8)):
+        if rng.random() < 0.5:
+            id_, name = rng.choice(KI_EMOTES)
+            words.append(f'[emote:{id_}:{name}]')
+        else:
+            words.append(rng.choice(WORDS))
+    return ' '.join(words)
+
+
+def chat_corpus(n: int, repeat: float = 0.7, seed: int = 1) -> list[tuple[str, str, str]]:
+    """
+    n mensagens (plataforma, texto, tag). `repeat` é a fração que repete uma mensagem recente —
+    em live, spam de emote e "KKKK" dominam o chat.
+    """
+    rng = random.Random(seed)
+    out: list[tuple[str, str, str]] = []
+    for _ in range(n):
+        if out and rng.random() < repeat:
+            out.append(rng.choice(out[-200:]))
+        elif rng.random() < 0.5:
+            out.append(('tw', *_tw_line(rng)))
+        else:
+            out.append(('ki', _ki_line(rng), ''))
+    return out
+
+
+def irc_traffic(n: int, seed: int = 1) -> list[str]:
+    """
+    Linhas IRC no formato que o irc-ws.chat.twitch.tv manda (tags completas, como numa captura real):
+    ~95% PRIVMSG, o resto USERNOTICE/NOTICE/PING/ROOMSTATE.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n):
+        user = f'viewer{rng.randint(1, 3000)}'
+        text, emotes = _tw_line(rng)
+        base = (
+            f'badge-info=subscriber/{rng.randint(1, 40)};badges=subscriber/12,premium/1;'
+            f'client-nonce={rng.getrandbits(128):032x};color=#{rng.getrandbits(24):06X};'
+            f'display-name={user.title()};emotes={emotes};first-msg=0;flags=;'
+            f'id={rng.getrandbits(128):032x};mod=0;returning-chatter=0;room-id=123456789;'
+            f'subscriber=1;tmi-sent-ts={1700000000000 + i * 250};turbo=0;user-id={rng.randint(1, 10**9)}'
+        )
+        if rng.random() < 0.01:
+            text += ' alguém viu o USERNOTICE do raid?'  # texto que engana a classificação por substring
+        r = rng.random()
+        if r < 0.95:
+            lines.append(f'@{base};user-type= :{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #xumbr3ga :{text}')
+        elif r < 0.97:
+            lines.append(
+                f'@{base};msg-id=resub;msg-param-cumulative-months=7;'
+                f'system-msg={user}\\ssubscribed\\sat\\sTier\\s1.;user-type= :tmi.twitch.tv USERNOTICE #xumbr3ga :{text}'
+            )
+        elif r < 0.98:
+            lines.append('@msg-id=msg_ratelimit :tmi.twitch.tv NOTICE #xumbr3ga :Your message was not sent.')
+        elif r < 0.99:
+            lines.append('PING :tmi.twitch.tv')
+        else:
+            lines.append('@emote-only=0;followers-only=-1;r9k=0;room-id=123456789;slow=0;subs-only=0 '
+                         ':tmi.twitch.tv ROOMSTATE #xumbr3ga')
+    return lines
+
+
+# ── render ────────────────────────────────────────────────────────────────────
+
+def bench_render(args):
+    corpus = chat_corpus(args.messages, repeat=args.repeat)
+    tw_raw, ki_raw = server.tw_render.__wrapped__, server.ki_render.__wrapped__
+
+    def run(tw, ki) -> float:
+        # Cada rodada começa com os caches vazios — mede hits de verdade, não um cache já aquecido
+        for fn in (server.tw_render, server.ki_render, server._tw_emote_img, server._ki_emote_img):
+            fn.cache_clear()
+        t0 = time.perf_counter()
+        for p, text, tag in corpus:
+            if p == 'tw':
+                tw(text, tag)
+            else:
+                ki(text)
+        return time.perf_counter() - t0
+
+    cold = min(run(tw_raw, ki_raw) for _ in range(args.rounds))
+    warm = min(run(server.tw_render, server.ki_render) for _ in range(args.rounds))
+
+    n = len(corpus)
+    print(f'corpus: {n} mensagens ({args.repeat:.0%} repetidas)')
+    print(f'  sem cache de mensagem: {cold * 1e3:8.1f} ms  ({cold / n * 1e6:6.2f} µs/msg)')
+    print(f'  com cache de mensagem: {warm * 1e3:8.1f} ms  ({warm / n * 1e6:6.2f} µs/msg)  → {cold / warm:.1f}x')
+    for name, info in server.render_cache_stats().items():
+        total = info['hits'] + info['misses']
+        rate = info['hits'] / total if total else 0
+        print(f'  {name:<10} hits={info["hits"]:<8} misses={info["misses"]:<8} '
+              f'tamanho={info["currsize"]:<6} taxa={rate:.0%}')
+
+
+# ── irc ───────────────────────────────────────────────────────────────────────
+
+def _legacy_tw_tags(line: str) -> dict:
+    raw = re.match(r'^@([^ ]+)', line)
+    if not raw:
+        return {}
+    return dict(t.split('=', 1) if '=' in t else (t, '') for t in raw.group(1).split(';'))
+
+
+def legacy_classify(line: str):
+    """Caminho antigo do twitch_loop: substring para decidir o tipo e depois regex sobre a linha inteira."""
+    if line.startswith('PING'):
+        return 'PING', None
+    if 'End of /NAMES list' in line:
+        return '366', None
+    if 'USERNOTICE' in line:
+        return 'USERNOTICE', _legacy_tw_tags(line)
+    if 'PRIVMSG' in line:
+        tags = _legacy_tw_tags(line)
+        m = re.search(r'PRIVMSG #\S+ :(.+)$', line)
+        return 'PRIVMSG', (tags, m.group(1) if m else None)
+    if 'NOTICE' in line:
+        m = re.search(r'NOTICE \S+ :(.+)$', line)
+        return 'NOTICE', m and m.group(1)
+    if re.search(r' 40[36] ', line):
+        return '403', None
+    return None, None
+
+
+def bench_irc(args):
+    if args.file:
+        lines = [l for l in Path(args.file).read_text(encoding='utf-8').splitlines() if l]
+        origem = args.file
+    else:
+        lines = irc_traffic(args.messages)
+        origem = 'tráfego sintético'
+
+    def run(fn) -> float:
+        t0 = time.perf_counter()
+        for line in lines:
+            fn(line)
+        return time.perf_counter() - t0
+
+    legacy = min(run(legacy_classify) for _ in range(args.rounds))
+    parsed = min(run(server.parse_irc) for _ in range(args.rounds))
+
+    # Onde os dois caminhos discordam do tipo da linha (ex: PRIVMSG com "NOTICE" no texto)
+    mismatch = 0
+    for line in lines:
+        cmd = server.parse_irc(line).command
+        old = legacy_classify(line)[0]
+        if old != (cmd if cmd in ('PING', '366', 'USERNOTICE', 'PRIVMSG', 'NOTICE', '403', '406') else None):
+            mismatch += 1
+
+    n = len(lines)
+    print(f'{n} linhas IRC ({origem})')
+    print(f'  substring + regex: {legacy * 1e3:8.1f} ms  ({legacy / n * 1e6:6.2f} µs/linha)')
+    print(f'  parse_irc:         {parsed * 1e3:8.1f} ms  ({parsed / n * 1e6:6.2f} µs/linha)  → {legacy / parsed:.1f}x')
+    print(f'  classificação divergente: {mismatch} linha(s)')
+
+
+# ── load ──────────────────────────────────────────────────────────────────────
+# O hub de verdade (server.main) roda num processo filho apontado para stand-ins locais: um servidor IRC
+# sobre WebSocket no formato da Twitch, um servidor Pusher no formato do Kick e um HTTP que responde
+# live_chat/get_live_chat como o YouTube. Cada mensagem de chat leva um token LT<n> no texto; os clientes
+# SSE simulados acham o token no frame e medem a latência desde o envio no stand-in.
+
+_TOKEN = re.compile(rb'\bLT(\d+)\b')
+_SKIPPED = re.compile(r'⏩ (\d+) mensagens puladas'.encode())
+
+
+class LoadFeed:
+    """Mensagens enviadas pelos stand-ins: token → (plataforma, instante do envio)."""
+
+    def __init__(self):
+        self.sent: dict[int, tuple[str, float]] = {}
+        self.count = {'tw': 0, 'ki': 0, 'yt': 0}
+        self.rng = random.Random(1)
+        self.ready = {p: asyncio.Event() for p in ('tw', 'ki', 'yt')}
+        self.tw_ws: web.WebSocketResponse | None = None
+        self.ki_ws: web.WebSocketResponse | None = None
+        self.yt_pending: list[dict] = []
+        self.yt_timeout_ms = 1000
+
+    def token(self, platform: str) -> int:
+        n = len(self.sent) + 1
+        self.sent[n] = (platform, time.monotonic())
+        self.count[platform] += 1
+        return n
+
+    def text(self, n: int) -> str:
+        return f'LT{n} ' + ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(1, 6)))
+
+
+def _tw_privmsg(feed: LoadFeed, n: int) -> str:
+    user = f'viewer{feed.rng.randint(1, 3000)}'
+    return (f'@badge-info=;badges=;color=#1E90FF;display-name={user};emotes=25:0-4;id={n};'
+            f'tmi-sent-ts={int(time.time() * 1000)};user-type= :{user}!{user}@{user}.tmi.twitch.tv '
+            f'PRIVMSG #bench :Kappa {feed.text(n)}')
+
+
+def _ki_event(feed: LoadFeed, n: int) -> str:
+    data = {'id': str(n), 'content': f'[emote:37226:KEKLEO] {feed.text(n)}',
+            'sender': {'username': f'viewer{feed.rng.randint(1, 3000)}', 'identity': {'color': '#53FC18'}}}
+    return json.dumps({'event': 'App\\Events\\ChatMessageEvent', 'channel': 'chatrooms.1.v2', 'data': json.dumps(data)})
+
+
+def _yt_action(feed: LoadFeed, n: int) -> dict:
+    return {'addChatItemAction': {'item': {'liveChatTextMessageRenderer': {
+        'authorName': {'simpleText': f'viewer{feed.rng.randint(1, 3000)}'},
+        'message': {'runs': [{'text': feed.text(n)}]},
+        'timestampUsec': str(int(time.time() * 1e6)),
+    }}}}
+
+
+async def _tw_standin(request: web.Request) -> web.WebSocketResponse:
+    """IRC da Twitch sobre WebSocket: responde o JOIN com 366 e daí em diante recebe o tráfego do driver."""
+    feed: LoadFeed = request.app['feed']
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    async for msg in ws:
+        if msg.type != WSMsgType.TEXT:
+            break
+        for line in msg.data.split('\r\n'):
+            if line.startswith('JOIN '):
+                for ch in line[5:].split(','):
+                    await ws.send_str(f':justinfan.tmi.twitch.tv 366 justinfan {ch} :End of /NAMES list')
+                feed.tw_ws = ws
+                feed.ready['tw'].set()
+    return ws
+
+
+async def _ki_standin(request: web.Request) -> web.WebSocketResponse:
+    """Pusher do Kick: connection_established, subscription_succeeded para cada chatroom, depois o tráfego."""
+    feed: LoadFeed = request.app['feed']
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    await ws.send_str(json.dumps({'event': 'pusher:connection_established',
+                                  'data': json.dumps({'socket_id': '1.1', 'activity_timeout': 120})}))
+    async for msg in ws:
+        if msg.type != WSMsgType.TEXT:
+            break
+        event = json.loads(msg.data)
+        if event.get('event') == 'pusher:subscribe':
+            channel = event['data']['channel']
+            await ws.send_str(json.dumps({'event': 'pusher_internal:subscription_succeeded', 'channel': channel, 'data': '{}'}))
+            feed.ki_ws = ws
+            feed.ready['ki'].set()
+    return ws
+
+
+async def _yt_page_standin(request: web.Request) -> web.Response:
+    return web.Response(text='<script>{"reloadContinuationData":{"continuation":"benchcontinuationtoken0001"}}</script>',
+                        content_type='text/html')
+
+
+async def _yt_poll_standin(request: web.Request) -> web.Response:
+    """get_live_chat: devolve tudo que o driver acumulou desde o último poll."""
+    feed: LoadFeed = request.app['feed']
+    actions, feed.yt_pending = feed.yt_pending, []
+    feed.ready['yt'].set()  # o hub descarta as ações do primeiro poll — só começa a contar depois dele
+    return web.json_response({'continuationContents': {'liveChatContinuation': {
+        'continuations': [{'timedContinuationData': {'continuation': 'benchcontinuationtoken0001',
+                                                     'timeoutMs': feed.yt_timeout_ms}}],
+        'actions': actions,
+    }}})
+
+
+async def _send(feed: LoadFeed, platform: str, n: int):
+    """Envia n mensagens de uma vez pela plataforma (num frame só na Twitch, como o IRC faz em rajada)."""
+    if platform == 'tw':
+        await feed.tw_ws.send_str('\r\n'.join(_tw_privmsg(feed, feed.token('tw')) for _ in range(n)))
+    elif platform == 'ki':
+        for _ in range(n):
+            await feed.ki_ws.send_str(_ki_event(feed, feed.token('ki')))
+    else:
+        feed.yt_pending.extend(_yt_action(feed, feed.token('yt')) for _ in range(n))
+
+
+async def _drive(feed: LoadFeed, platform: str, args):
+    """Taxa constante de args.rate msg/s, mais args.burst mensagens de uma vez a cada args.burst_every s."""
+    loop = asyncio.get_running_loop()
+    start = last = loop.time()
+    next_burst = start + args.burst_every
+    credit = 0.0
+    while (now := loop.time()) - start < args.duration:
+        credit += args.rate * (now - last)
+        last = now
+        n = int(credit)
+        credit -= n
+        if args.burst and now >= next_burst:
+            n += args.burst
+            next_burst += args.burst_every
+        if n:
+            await _send(feed, platform, n)
+        await asyncio.sleep(0.01)
+
+
+class SimClient:
+    """Cliente SSE simulado. delay > 0 = lê devagar (browser source engasgado)."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.seen: set[int] = set()
+        self.latency: dict[str, list[float]] = {'tw': [], 'ki': [], 'yt': []}
+        self.skipped = 0
+        self.duplicates = 0
+
+    async def run(self, session: ClientSession, url: str, feed: LoadFeed, stop: asyncio.Event):
+        async with session.get(url, timeout=ClientTimeout(total=None)) as resp:
+            buf = b''
+            while not stop.is_set():
+                try:
+                    chunk = await asyncio.wait_for(resp.content.readany(), 0.2)
+                except asyncio.TimeoutError:
+                    continue
+                if not chunk:
+                    break
+                now = time.monotonic()
+                *events, buf = (buf + chunk).split(b'\n\n')
+                for ev in events:
+                    if m := _TOKEN.search(ev):
+                        n = int(m.group(1))
+                        if n in self.seen:
+                            self.duplicates += 1
+                            continue
+                        self.seen.add(n)
+                        platform, sent_at = feed.sent[n]
+                        self.latency[platform].append(now - sent_at)
+                    elif m := _SKIPPED.search(ev):
+                        self.skipped += int(m.group(1))
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+
+
+def _hub_process(port: int, urls: tuple[str, str, str], workdir: str, cfg: dict):
+    """Processo filho: server.main de verdade, com histórico e emotes num diretório temporário e log em arquivo."""
+    work = Path(workdir)
+    sys.stdout = open(work / 'hub.log', 'w', encoding='utf-8', buffering=1)
+    os.dup2(sys.stdout.fileno(), 1)  # workers (--workers) herdam o fd e logam no mesmo arquivo
+    server.TW_IRC_URL, server.KI_PUSHER_URL, server.YT_BASE_URL = urls
+    server.HISTORY_FILE = work / 'messages.jsonl'
+    server.HISTORY_DIR = work / 'history'
+    server.HISTORY_MANIFEST = server.HISTORY_DIR / 'manifest.json'
+    server.HISTORY_DB = work / 'history.db'
+    server.EMOTE_CACHE_DIR = work / 'emote_cache'  # server.start_workers repassa esses caminhos aos workers
+    asyncio.run(server.main(cfg))
+
+
+def _proc_stats(pid: int) -> tuple[float | None, float | None, float | None]:
+    """(RSS MB, pico de RSS MB, CPU s) do processo — só no Linux (/proc); senão None."""
+    try:
+        status = Path(f'/proc/{pid}/status').read_text()
+        fields = Path(f'/proc/{pid}/stat').read_text().rsplit(')', 1)[1].split()
+    except OSError:
+        return None, None, None
+    mem = {k: int(v.split()[0]) / 1024 for k, v in (l.split(':', 1) for l in status.splitlines() if l.startswith('Vm'))}
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return mem.get('VmRSS'), mem.get('VmHWM'), cpu
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _pct(values: list[float], q: float) -> float:
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+async def _load(args):
+    platforms = [p for p in args.platforms.split(',') if p in ('tw', 'ki', 'yt')]
+    feed = LoadFeed()
+    feed.yt_timeout_ms = args.yt_timeout_ms
+
+    app = web.Application()
+    app['feed'] = feed
+    app.router.add_get('/tw', _tw_standin)
+    app.router.add_get('/app/{key}', _ki_standin)
+    app.router.add_get('/live_chat', _yt_page_standin)
+    app.router.add_post('/youtubei/v1/live_chat/get_live_chat', _yt_poll_standin)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    standin_port = _free_port()
+    await web.TCPSite(runner, '127.0.0.1', standin_port).start()
+    base = f'127.0.0.1:{standin_port}'
+
+    workdir = tempfile.mkdtemp(prefix='xumbrega-load-')
+    hub_port = _free_port()
+    cfg = {
+        'tw': 'tw' in platforms, 'tw_channel': 'bench',
+        'ki': 'ki' in platforms, 'ki_channel': 'bench', 'ki_id': '1',
+        'yt': 'benchvideo1' if 'yt' in platforms else '',
+        'port': hub_port, 'history_sync': args.history_sync, 'workers': args.workers,
+        'history_backend': args.history_backend,
+    }
+    urls = (f'ws://{base}/tw', f'ws://{base}/app/{server.PUSHER_KEY}?protocol=7', f'http://{base}')
+    hub = multiprocessing.get_context('spawn').Process(target=_hub_process, args=(hub_port, urls, workdir, cfg))
+    hub.start()
+
+    stop = asyncio.Event()
+    async with ClientSession() as session:
+        try:
+            await asyncio.wait_for(asyncio.gather(*(feed.ready[p].wait() for p in platforms)), 30)
+        except asyncio.TimeoutError:
+            print(f'hub não conectou nos stand-ins em 30s — veja {workdir}/hub.log')
+            hub.terminate()
+            await runner.cleanup()
+            return
+
+        url = f'http://localhost:{hub_port}/events?kinds=chat'
+        sims = [SimClient(args.slow_delay if i < args.slow else 0.0) for i in range(args.clients)]
+        readers = [asyncio.create_task(c.run(session, url, feed, stop)) for c in sims]
+        await asyncio.sleep(0.5)
+
+        rss0, _, cpu0 = _proc_stats(hub.pid)
+        t0 = time.monotonic()
+        await asyncio.gather(*(_drive(feed, p, args) for p in platforms))
+        await asyncio.sleep(args.drain)
+        elapsed = time.monotonic() - t0
+        rss1, peak, cpu1 = _proc_stats(hub.pid)
+
+        stop.set()
+        await asyncio.gather(*readers, return_exceptions=True)
+
+    hub.terminate()
+    hub.join(10)
+    if hub.is_alive():
+        hub.kill()
+    await runner.cleanup()
+
+    sent = len(feed.sent)
+    expected = sent * len(sims)
+    delivered = sum(len(c.seen) for c in sims)
+    skipped = sum(c.skipped for c in sims)
+    burst = f' + rajada de {args.burst} a cada {args.burst_every:g}s' if args.burst else ''
+    print(f'carga: {args.duration:g}s, {args.rate:g} msg/s por plataforma{burst} → {", ".join(platforms)}; '
+          f'{len(sims)} clientes SSE ({args.slow} lentos)')
+    print(f'enviadas:  {sent} ({", ".join(f"{p}={feed.count[p]}" for p in platforms)}) — {sent / args.duration:.0f} msg/s')
+    print(f'entregues: {delivered} de {expected} ({delivered / max(expected, 1):.1%}) — {delivered / elapsed:.0f} msg/s')
+    for label, group in (('normais', sims[args.slow:]), ('lentos', sims[:args.slow])):
+        if group:
+            got = sum(len(c.seen) for c in group)
+            print(f'  clientes {label}: {got / (sent * len(group)):.1%} entregue')
+    print(f'descartes: {expected - delivered} (avisadas como puladas: {skipped}; duplicadas: {sum(c.duplicates for c in sims)})')
+    print('latência stand-in → cliente SSE:')
+    for p in platforms:
+        lat = sorted(x for c in sims for x in c.latency[p])
+        if lat:
+            print(f'  {p}  p50={_pct(lat, .5) * 1e3:7.1f} ms  p95={_pct(lat, .95) * 1e3:7.1f} ms  '
+                  f'p99={_pct(lat, .99) * 1e3:7.1f} ms  max={lat[-1] * 1e3:7.1f} ms')
+    if rss0 is not None:
+        who = f'processo de ingestão; {args.workers} workers à parte' if args.workers else 'processo único'
+        print(f'hub ({who}): RSS {rss0:.0f} → {rss1:.0f} MB (pico {peak:.0f} MB), CPU {cpu1 - cpu0:.1f}s '
+              f'({(cpu1 - cpu0) / elapsed:.0%} de um núcleo)')
+    print(f'log do hub: {workdir}/hub.log')
+
+
+def bench_load(args):
+    asyncio.run(_load(args))
+
+
+# ── history ───────────────────────────────────────────────────────────────────
+
+def history_corpus(n: int, seed: int = 1) -> list[server.Envelope]:
+    """n mensagens já renderizadas, com id/ts como o broadcast carimba (uma a cada 50ms)."""
+    rng = random.Random(seed)
+    envs = []
+    for i, (p, text, tag) in enumerate(chat_corpus(n, seed=seed)):
+        html = server.tw_render(text, tag) if p == 'tw' else server.ki_render(text)
+        envs.append(server.Envelope({'p': p, 'ch': 'bench', 'user': f'viewer{rng.randint(1, 3000)}', 'color': '',
+                                     'html': html, 'id': 1_000_000 + i, 'ts': 1_700_000_000_000 + i * 50}))
+    return envs
+
+
+def _median_ms(fn, rounds: int) -> float:
+    times = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return sorted(times)[len(times) // 2] * 1e3
+
+
+def bench_history(args):
+    envs = history_corpus(args.messages)
+    last = envs[-1].msg
+    queries = [
+        ('user=viewer42', dict(users=frozenset({'viewer42'}))),
+        ('platform=ki&since=10m', dict(platforms=frozenset({'ki'}), since=last['ts'] - 600_000)),
+        ('q=kekw', dict(words=['kekw'])),
+        ('q=salve+mano&platform=tw', dict(words=['salve', 'mano'], platforms=frozenset({'tw'}))),
+        ('página no meio (before=)', dict(before=last['id'] - args.messages // 2)),
+        ('q=kappa&limit=1000', dict(words=['kappa'], limit=1000)),
+    ]
+    server.HISTORY_SYNC = args.history_sync
+    results: dict[str, dict[str, str]] = {}
+    for backend in args.backends.split(','):
+        work = Path(tempfile.mkdtemp(prefix='xumbrega-hist-'))
+        server.HISTORY_FILE = work / 'messages.jsonl'
+        server.HISTORY_DIR = work / 'history'
+        server.HISTORY_MANIFEST = server.HISTORY_DIR / 'manifest.json'
+        server.HISTORY_DB = work / 'history.db'
+        r = results[backend] = {}
+        try:
+            store = server._store = server.make_store(backend)
+            store.open()
+            t0 = time.perf_counter()
+            for i in range(0, len(envs), server.HISTORY_BATCH):
+                store.write(envs[i:i + server.HISTORY_BATCH])
+            append = time.perf_counter() - t0
+            store.close()
+            r['gravação'] = f'{len(envs) / append / 1000:.0f}k msg/s'
+
+            # "replay": o start (cache das últimas 500) e a leitura completa (--replay, montagem do índice)
+            store = server._store = server.make_store(backend)
+            t0 = time.perf_counter()
+            store.open()
+            r['start (cache de 500)'] = f'{(time.perf_counter() - t0) * 1e3:.1f} ms'
+            t0 = time.perf_counter()
+            kept = sum(1 for _ in store.lines())
+            r['leitura completa'] = f'{(time.perf_counter() - t0) * 1e3:.0f} ms ({kept} msgs)'
+            if isinstance(store, server.SqliteStore):
+                index = store
+                r['índice do /history'] = '— (no banco)'
+            else:
+                t0 = time.perf_counter()
+                index = server._load_history_index()
+                r['índice do /history'] = f'{(time.perf_counter() - t0) * 1e3:.0f} ms'
+            for label, q in queries:
+                r[label] = f'{_median_ms(lambda: index.query(**q), args.rounds):.2f} ms'
+            r['disco'] = f'{sum(f.stat().st_size for f in work.rglob("*") if f.is_file()) / 1e6:.1f} MB'
+            store.close()
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+            # Solta o índice em memória antes do próximo backend — senão uma coleta do GC cai nas medições dele
+            index = store = server._store = None
+            gc.collect()
+
+    backends = list(results)
+    print(f'{len(envs)} mensagens, lotes de {server.HISTORY_BATCH}, history_sync={args.history_sync}, '
+          f'retenção {server.HISTORY_LIMIT}')
+    print(f'{"":<28}' + ''.join(f'{b:>24}' for b in backends))
+    for key in results[backends[0]]:
+        print(f'{key:<28}' + ''.join(f'{results[b][key]:>24}' for b in backends))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest='cmd', required=True)
+
+    p = sub.add_parser('render', help='renderização de emotes Twitch/Kick')
+    p.add_argument('--messages', type=int, default=50_000)
+    p.add_argument('--repeat', type=float, default=0.7, help='fração de mensagens repetidas (spam)')
+    p.add_argument('--rounds', type=int, default=3)
+    p.set_defaults(fn=bench_render)
+
+    p = sub.add_parser('irc', help='parser IRC da Twitch')
+    p.add_argument('--messages', type=int, default=50_000)
+    p.add_argument('--file', help='captura IRC real (uma linha por mensagem) no lugar do tráfego sintético')
+    p.add_argument('--rounds', type=int, default=3)
+    p.set_defaults(fn=bench_irc)
+
+    p = sub.add_parser('load', help='hub completo contra stand-ins locais de Twitch/Kick/YouTube')
+    p.add_argument('--duration', type=float, default=10, help='segundos de carga')
+    p.add_argument('--rate', type=float, default=100, help='mensagens/s por plataforma')
+    p.add_argument('--burst', type=int, default=0, help='mensagens extras de uma vez, por plataforma')
+    p.add_argument('--burst-every', type=float, default=5, help='intervalo entre rajadas (s)')
+    p.add_argument('--platforms', default='tw,ki,yt')
+    p.add_argument('--clients', type=int, default=4, help='clientes SSE simulados')
+    p.add_argument('--slow', type=int, default=0, help='quantos desses clientes leem devagar')
+    p.add_argument('--slow-delay', type=float, default=0.05, help='pausa entre leituras de um cliente lento (s)')
+    p.add_argument('--yt-timeout-ms', type=int, default=1000, help='timeoutMs devolvido pelo stand-in do YouTube')
+    p.add_argument('--history-sync', default='flush', choices=('none', 'flush', 'fsync'))
+    p.add_argument('--history-backend', default='segments', choices=('segments', 'sqlite'))
+    p.add_argument('--workers', type=int, default=0, help='processos servindo o SSE (SSE_WORKERS do hub)')
+    p.add_argument('--drain', type=float, default=3, help='espera após a carga para os clientes receberem o resto (s)')
+    p.set_defaults(fn=bench_load)
+
+    p = sub.add_parser('history', help='backends do histórico: gravação, start, leitura e consultas do /history')
+    p.add_argument('--messages', type=int, default=50_000)
+    p.add_argument('--backends', default='segments,sqlite')
+    p.add_argument('--history-sync', default='flush', choices=('none', 'flush', 'fsync'))
+    p.add_argument('--rounds', type=int, default=21)
+    p.set_defaults(fn=bench_history)
+
+    args = ap.parse_args()
+    args.fn(args)
+
+
+if __name__ == '__main__':
+    main()
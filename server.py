@@ -7,33 +7,132 @@ Browser Sources (porta configurada no dialog, padrão 8080):
 """
 import asyncio
 import sys
+import time
 import os
 import signal
+import socket
+import struct
 import json
 import html as html_lib
 import re
 import mimetypes
 import datetime
+import functools
+import gzip
+import hashlib
+import itertools
+import random
+from typing import TYPE_CHECKING, NamedTuple
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
 from pathlib import Path
-from aiohttp import web, ClientSession, WSMsgType, ClientTimeout
+from urllib.parse import urlsplit
+from aiohttp import web, ClientSession, WSMsgType, ClientTimeout, TCPConnector, TraceConfig
 
+try:
+    import brotli  # opcional — sem ele os estáticos saem só em gzip
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl  # só POSIX — serializa o index.json do cache de emotes entre workers (que também são só POSIX)
+except ImportError:
+    fcntl = None
+
+if TYPE_CHECKING:
+    import sqlite3  # só pras anotações — o import de verdade fica em _sqlite_connect
+
+
+def _process_start() -> float:
+    """
+    Início do processo no relógio do time.monotonic(): no Linux vem do /proc (conta o interpretador e os
+    imports — o aiohttp sozinho leva ~200 ms); fora dele, o instante deste import.
+    """
+    try:
+        fields = Path('/proc/self/stat').read_text().rsplit(')', 1)[1].split()
+        age = time.clock_gettime(time.CLOCK_BOOTTIME) - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        return time.monotonic() - age
+    except (OSError, AttributeError, ValueError, IndexError):
+        return time.monotonic()
+
+
+_STARTED = _process_start()  # base do tempo até abrir a porta e até o primeiro byte SSE
 DIR = Path(__file__).parent
-TW_CH = 'xumbr3ga'
-KI_CH = 'xumbr3ga'
-KI_CHATROOM_ID = '45573790'
+# Registro de canais: uma conexão por plataforma, vários canais nela. Chave = id na conexão, valor = rótulo
+# que vai no campo 'ch' de cada mensagem.
+CHANNELS: dict[str, dict[str, str]] = {
+    'tw': {'xumbr3ga': 'xumbr3ga'},  # canal IRC (minúsculo) → canal
+    'ki': {'45573790': 'xumbr3ga'},  # chatroom ID → canal
+    'yt': {},                        # video ID → video ID
+}
 PUSHER_KEY = '32cbd69e4b950bf97679'
 PUSHER_CLUSTER = 'us2'
-
-clients: set[asyncio.Queue] = set()
-HISTORY_FILE   = DIR / 'messages.jsonl'
+# Endpoints das plataformas — o bench.py aponta para servidores locais que imitam cada uma
+TW_IRC_URL     = 'wss://irc-ws.chat.twitch.tv:443'
+KI_PUSHER_URL  = f'wss://ws-{PUSHER_CLUSTER}.pusher.com/app/{PUSHER_KEY}?protocol=7&client=py&version=7.6.0'
+YT_BASE_URL    = 'https://www.youtube.com'
+
+clients: set['SSEClient'] = set()
+HISTORY_FILE   = DIR / 'messages.jsonl'  # formato antigo (arquivo único) — migrado no start
+HISTORY_DIR    = DIR / 'history'
+HISTORY_MANIFEST = HISTORY_DIR / 'manifest.json'
 CONFIG_FILE    = DIR / 'config.json'
 LOCK_FILE      = DIR / 'server.lock'
-HISTORY_LIMIT  = 50_000  # máximo de mensagens no arquivo
-HISTORY_TRIM   = 40_000  # quantas remover quando estoura (mantém 10k)
+HISTORY_LIMIT  = 50_000  # máximo de mensagens somando todos os segmentos
+HISTORY_SEGMENT = 10_000 # mensagens por segmento (retenção descarta segmentos inteiros)
 HISTORY_REPLAY = 500     # quantas enviar no SSE ao reconectar
+HISTORY_BATCH  = 256     # writer grava quando junta esse tanto de mensagens...
+HISTORY_BATCH_MS = 5     # ...ou quando passa esse tempo desde a primeira do lote
+HISTORY_META_INTERVAL = 1.0  # segundos entre atualizações do meta.json (start O(1)); também grava na rotação e no close
+SSE_CLIENT_BUFFER = 200  # frames pendentes por cliente; cheio → descarta os mais antigos
+SSE_LAG_POLICY = 'collapse'  # 'drop' descarta calado; 'collapse' avisa "N mensagens puladas" no lugar
+SSE_STALL_TIMEOUT = 30   # segundos com buffer cheio sem conseguir escrever → desconecta
+SSE_BATCH_BYTES = 64 * 1024  # teto de bytes por write quando o cliente tem várias mensagens prontas
+SSE_FLUSH_MS   = 2       # em rajada, espera isso pra juntar mais antes do write (0 = desliga)
+HISTORY_SYNC   = 'flush' # durabilidade por lote: 'none' (buffer do Python), 'flush' (SO) ou 'fsync' (disco)
+HISTORY_BACKEND = 'segments'  # 'segments' (NDJSON em history/) ou 'sqlite' (history.db em WAL)
+HISTORY_DB     = DIR / 'history.db'
+HISTORY_MAX_AGE_H = 0    # sqlite: apaga mensagens mais velhas que isso (horas; 0 = só o limite de quantidade)
+HISTORY_DELETE_CHUNK = 500  # sqlite: máximo de linhas apagadas pela retenção a cada lote gravado
+HISTORY_PERSIST = True   # False no modo replay — mensagens re-transmitidas não voltam pro histórico
+REPLAY_GAP     = 0.25    # intervalo no replay entre linhas sem timestamp (s, antes do fator de velocidade)
+REPLAY_MAX_GAP = 10.0    # silêncio máximo reproduzido (s) — pausas maiores na gravação são comprimidas
+REPLAY_READ_BATCH = 1000 # linhas lidas da fonte por vez, numa thread (o disco não trava o loop)
 platform_status = {'tw': False, 'ki': False, 'yt': False}
-_history_lock: asyncio.Lock | None = None  # initialized in main()
+# Prioridade dos frames (filtro ?min_priority= do /events). 'reload' sempre passa.
+PRIO_CHAT, PRIO_SYS, PRIO_EVENT = 0, 1, 2  # chat comum / avisos e status / sub, raid, super chat, membro
+RENDER_CACHE_SIZE = 4096  # mensagens renderizadas em cache (LRU) — spam de emote repete muito
+EMOTE_CACHE_SIZE  = 2048  # fragmentos <img> por emote
+STATIC_CACHE_SIZE = 256   # arquivos estáticos prontos (corpo + gzip/br) em memória (LRU)
+EMOTE_PROXY    = True    # <img> apontam pro /emote/... local (cache em disco) em vez da CDN de cada plataforma
+EMOTE_CACHE_DIR = DIR / 'emote_cache'
+EMOTE_HOT_SIZE = 512     # imagens de emote mantidas em memória (LRU)
+EMOTE_INDEX_FLUSH = 1.0  # segundos juntando emotes novos antes de regravar o emote_cache/index.json
+YT_POLL_MIN    = 0.5     # limites absolutos do intervalo de polling do YouTube (s)
+YT_POLL_MAX    = 30.0
+YT_POLL_MIN_FACTOR = 0.25  # quanto o intervalo pode encurtar/alongar em relação ao timeoutMs
+YT_POLL_MAX_FACTOR = 2.0
+YT_POLL_JITTER = 0.1
+YT_FULL_BATCH  = 20      # ações num poll a partir das quais o lote conta como "cheio"
+HTTP_LIMIT     = 32      # conexões simultâneas no pool compartilhado (todas as plataformas + emotes)
+HTTP_LIMIT_PER_HOST = 8
+HTTP_DNS_TTL   = 300     # cache de DNS do connector (s) — reconexão não refaz a resolução
+HTTP_KEEPALIVE = 60      # segundos que uma conexão ociosa fica no pool esperando reuso
+RECONNECT_MIN  = 1       # primeira tentativa após queda de uma conexão que estava ok (s); depois dobra até 60
+WATCH_DEBOUNCE = 0.3     # segundos sem novos eventos antes de recarregar (editor salva em rajada)
+DEFAULT_PAGE   = 'xumbrega_multichat.html'  # servida em /
+DEFAULT_HOST   = 'localhost'  # endereço da porta HTTP ('0.0.0.0' abre pra rede)
+SSE_RETRY_MS   = 500     # `retry:` do SSE — quanto o browser espera pra reconectar (restart do hub = ~isso de tela parada)
+SSE_WORKERS    = 0       # processos servindo /events e estáticos (0 = tudo no processo principal)
+WORKER_BUFFER_BYTES = 16 * 1024 * 1024  # bytes pendentes no canal de um worker antes de derrubá-lo
+WORKER_LINE_LIMIT = 1024 * 1024         # maior registro aceito no canal (uma mensagem serializada)
+LOG_TAG        = ''      # prefixo do log ('w1:' nos workers)
+_history_queue: asyncio.Queue | None = None  # initialized in main()
 _msg_count = 0
+_segments: list[list[int]] = []  # [[número, mensagens], ...] — o último é o segmento ativo
+_seq = 0  # id monotônico de cada frame broadcast (campo `id:` do SSE e `id` no histórico)
+# Últimos HISTORY_REPLAY frames SSE já serializados — replay sem tocar no disco
+_replay_tail: deque['Envelope'] = deque(maxlen=HISTORY_REPLAY)
 
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
@@ -42,52 +141,487 @@ def esc(s: str) -> str:
     return html_lib.escape(str(s or ''), quote=True)
 
 
+# ── Métricas (/metrics) ───────────────────────────────────────────────────────
+# Formato de exposição de texto do Prometheus. No caminho quente só há incremento de int em dict e um bisect
+# por histograma; o que já existe como estado (clientes, filas, links, caches) é lido só na hora do scrape.
+
+class Histogram:
+    """Histograma cumulativo: contagem por bucket (limite superior inclusivo), soma e total."""
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # último = +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def expose(self, name: str, labels: str = '') -> list[str]:
+        """Linhas _bucket/_sum/_count. labels já formatado, ex: 'stage="parse"'."""
+        lines, acc = [], 0
+        for bound, count in zip((*self.bounds, '+Inf'), self.counts):
+            acc += count
+            lines.append(f'{name}_bucket{{{labels + "," if labels else ""}le="{bound}"}} {acc}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.sum}')
+        lines.append(f'{name}_count{suffix} {acc}')
+        return lines
+
+
+_LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+frames_total: dict[tuple[str, str], int] = {}     # (kind, platform) → frames broadcast
+disconnects_total: dict[str, int] = {}            # motivo → clientes SSE desconectados
+dropped_total = 0                                 # frames descartados por clientes que já saíram
+deliveries_total = 0                              # frames entregues a clientes (fan-out médio = / frames)
+history_errors_total = 0
+broadcast_seconds = Histogram(_LATENCY_BUCKETS)
+history_write_seconds = Histogram(_LATENCY_BUCKETS)
+history_batch_size = Histogram((1, 4, 16, 64, 256, 1024))
+history_rotate_seconds = Histogram(_LATENCY_BUCKETS)
+# Latência ponta a ponta de cada mensagem de chat, por estágio: parse (frame do WS/poll → dict), render
+# (emotes → HTML), enqueue (broadcast até estar no buffer de todos os clientes), write (buffer → socket de
+# cada cliente), total (recebido → escrito). client_* vêm do próprio overlay via POST /trace (?debug=1).
+LATENCY_STAGES = ('parse', 'render', 'enqueue', 'write', 'total', 'client_queue', 'client_render')
+latency = {stage: Histogram((0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                             1, 2.5, 5)) for stage in LATENCY_STAGES}
+# Segundos do início do processo (_STARTED) até: listen (porta aberta) e first_sse_byte (primeiro write num /events)
+startup_seconds: dict[str, float] = {}
+_STARTUP_LABELS = {'listen': 'porta aberta', 'first_sse_byte': 'primeiro byte SSE'}
+
+
+def mark_startup(stage: str):
+    """Registra (uma vez por processo) quando o start chegou em stage."""
+    if stage not in startup_seconds:
+        startup_seconds[stage] = time.monotonic() - _STARTED
+        log('start', 'INFO', f'{_STARTUP_LABELS[stage]} {startup_seconds[stage] * 1e3:.0f} ms após o início do processo')
+
+
+def _labels(**labels) -> str:
+    def val(v) -> str:
+        return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{val(v)}"' for k, v in labels.items()) + '}'
+
+
+def render_metrics() -> str:
+    out: list[str] = []
+
+    def metric(name: str, kind: str, help_: str, samples=()):
+        out.append(f'# HELP {name} {help_}')
+        out.append(f'# TYPE {name} {kind}')
+        out.extend(f'{name}{_labels(**labels) if labels else ""} {value}' for labels, value in samples)
+
+    def histogram(name: str, help_: str, hist: Histogram):
+        metric(name, 'histogram', help_)
+        out.extend(hist.expose(name))
+
+    metric('hub_messages_total', 'counter', 'Mensagens de chat recebidas por plataforma.',
+           [({'platform': p}, n) for (kind, p), n in sorted(frames_total.items()) if kind == 'chat'])
+    metric('hub_frames_total', 'counter', 'Frames broadcast por tipo e plataforma.',
+           [({'kind': kind, 'platform': p or ''}, n) for (kind, p), n in sorted(frames_total.items(), key=str)])
+    histogram('hub_broadcast_seconds', 'Tempo do fan-out de um frame para todos os clientes.', broadcast_seconds)
+    metric('hub_broadcast_deliveries_total', 'counter', 'Frames enfileirados em clientes (soma do fan-out).',
+           [({}, deliveries_total)])
+
+    live = list(clients)
+    metric('hub_sse_clients', 'gauge', 'Clientes SSE conectados.', [({}, len(live))])
+    # Distribuição entre os clientes conectados (um ponto por cliente, montada no scrape) — série por conexão
+    # mudaria a cada reconexão de browser source
+    buckets = (0, 1, 4, 16, 64, SSE_CLIENT_BUFFER // 2, SSE_CLIENT_BUFFER)
+    pending, max_lag = Histogram(buckets), Histogram(buckets)
+    for c in live:
+        pending.observe(len(c.pending))
+        max_lag.observe(c.max_lag)
+    histogram('hub_sse_client_pending', 'Frames pendentes no buffer dos clientes conectados.', pending)
+    histogram('hub_sse_client_max_lag', 'Maior número de frames pendentes visto num write, por cliente conectado.',
+              max_lag)
+    metric('hub_sse_client_pending_max', 'gauge', 'Buffer mais cheio entre os clientes conectados.',
+           [({}, max((len(c.pending) for c in live), default=0))])
+    metric('hub_sse_buffer_size', 'gauge', 'Capacidade do buffer por cliente.', [({}, SSE_CLIENT_BUFFER)])
+    metric('hub_sse_dropped_total', 'counter', 'Frames descartados por clientes lentos.',
+           [({}, dropped_total + sum(c.dropped for c in live))])
+    metric('hub_sse_disconnects_total', 'counter', 'Clientes SSE desconectados por motivo.',
+           [({'reason': r}, n) for r, n in sorted(disconnects_total.items())])
+
+    metric('hub_history_queue', 'gauge', 'Mensagens esperando o writer do histórico.',
+           [({}, _history_queue.qsize() if _history_queue else 0)])
+    metric('hub_history_messages', 'gauge', 'Mensagens guardadas nos segmentos.', [({}, _msg_count)])
+    metric('hub_history_segments', 'gauge', 'Segmentos de histórico ativos.', [({}, len(_segments))])
+    metric('hub_history_errors_total', 'counter', 'Lotes que falharam ao gravar.', [({}, history_errors_total)])
+    histogram('hub_history_write_seconds', 'Latência de gravação de um lote.', history_write_seconds)
+    histogram('hub_history_batch_size', 'Mensagens por lote gravado.', history_batch_size)
+    histogram('hub_history_rotate_seconds', 'Tempo de rotação (manifest + remoção de segmentos).', history_rotate_seconds)
+
+    metric('hub_latency_seconds', 'histogram', 'Latência das mensagens de chat por estágio (recebido → escrito no socket).')
+    for stage, hist in latency.items():
+        out.extend(hist.expose('hub_latency_seconds', f'stage="{stage}"'))
+
+    metric('hub_platform_up', 'gauge', 'Plataforma conectada (1) ou não (0).',
+           [({'platform': p}, int(on)) for p, on in platform_status.items()])
+    metric('hub_link_connects_total', 'counter', 'Conexões estabelecidas por link.',
+           [({'link': name}, st['connects']) for name, st in sorted(link_stats.items())])
+    metric('hub_link_handshake_seconds', 'gauge', 'Duração do último handshake.',
+           [({'link': name}, st['handshake_ms'] / 1e3) for name, st in sorted(link_stats.items())])
+    metric('hub_link_downtime_seconds', 'gauge', 'Tempo fora na última reconexão.',
+           [({'link': name}, st['reconnect_s']) for name, st in sorted(link_stats.items())])
+    metric('hub_yt_poll_interval_seconds', 'gauge', 'Intervalo atual de polling de cada vídeo do YouTube.',
+           [({'video': vid}, sched.interval) for vid, sched in sorted(_yt_schedulers.items())])
+    metric('hub_yt_rate_limits_total', 'counter', 'Respostas 429 do YouTube por vídeo.',
+           [({'video': vid}, sched.rate_limits) for vid, sched in sorted(_yt_schedulers.items())])
+    metric('hub_yt_poll_batch', 'gauge', 'Ações do chat no último poll de cada vídeo do YouTube.',
+           [({'video': vid}, sched.batch) for vid, sched in sorted(_yt_schedulers.items())])
+    metric('hub_yt_delay_seconds', 'gauge', 'Atraso ponta a ponta do último lote (horário no YouTube → publicação).',
+           [({'video': vid}, round(sched.delay, 3)) for vid, sched in sorted(_yt_schedulers.items())
+            if sched.delay is not None])
+    metric('hub_http_connections_total', 'counter', 'Conexões HTTP abertas (new) e reaproveitadas do pool (reused).',
+           [({'host': host, 'state': state}, st[state]) for host, st in sorted(http_hosts.items())
+            for state in ('new', 'reused')])
+
+    caches = render_cache_stats()
+    metric('hub_render_cache_hits_total', 'counter', 'Hits dos caches de renderização.',
+           [({'cache': name}, info['hits']) for name, info in caches.items()])
+    metric('hub_render_cache_misses_total', 'counter', 'Misses dos caches de renderização.',
+           [({'cache': name}, info['misses']) for name, info in caches.items()])
+    metric('hub_startup_seconds', 'gauge', 'Tempo do início do processo até abrir a porta e até o primeiro byte SSE.',
+           [({'stage': stage}, round(sec, 4)) for stage, sec in startup_seconds.items()])
+    return '\n'.join(out) + '\n'
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(body=render_metrics().encode(),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+async def trace_handler(request: web.Request) -> web.Response:
+    """
+    POST /trace — overlays em ?debug=1 mandam em lote o que mediram do lado deles:
+    [{"id": 123, "queue_ms": 850.0, "render_ms": 3.2}, ...]. Vira client_queue/client_render no /metrics.
+    """
+    try:
+        reports = json.loads(await request.text())
+    except ValueError:
+        raise web.HTTPBadRequest(text='esperado um array JSON')
+    if not isinstance(reports, list):
+        raise web.HTTPBadRequest(text='esperado um array JSON')
+    for r in reports[:1000]:
+        if not isinstance(r, dict):
+            continue
+        for key, stage in (('queue_ms', 'client_queue'), ('render_ms', 'client_render')):
+            ms = r.get(key)
+            if isinstance(ms, (int, float)) and 0 <= ms < 600_000:
+                latency[stage].observe(ms / 1e3)
+    return web.Response(status=204)
+
+
 # ── Broadcast & persist ───────────────────────────────────────────────────────
 
-def broadcast(msg: dict):
-    """Enqueue msg for all connected SSE clients."""
-    data = f"data: {json.dumps(msg, ensure_ascii=False)}\n\n"
-    dead = set()
-    for q in clients:
-        try:
-            q.put_nowait(data)
-        except asyncio.QueueFull:
-            dead.add(q)
-    for q in dead:
-        clients.discard(q)
-        # Sinaliza ao handler para fechar a conexão — força reconexão automática do browser
+class Envelope:
+    """Mensagem serializada uma única vez — linha JSON e frame SSE são calculados sob demanda e reaproveitados."""
+    __slots__ = ('_msg', '_json', '_frame', '_debug_frame', 'seq', 'kind', 'platform', 'priority', 'trace')
+
+    def __init__(self, msg: dict | None = None, json_line: str | None = None):
+        self._msg = msg
+        self._json = json_line
+        self._frame: bytes | None = None
+        self._debug_frame: bytes | None = None
+        # perf_counter de cada estágio: (recebido, parseado, renderizado, enfileirado) — só mensagens de chat ao vivo
+        self.trace: tuple[float, ...] | None = None
+        m = self.msg
+        self.seq: int | None = None if msg is not None else m.get('id')
+        p = m.get('p')
+        # Metadados pros filtros de inscrição — resolvidos uma vez, antes de qualquer serialização
+        self.kind = 'chat' if p in platform_status else p
+        self.platform = p if self.kind == 'chat' else m.get('platform')
+        self.priority = m.get('prio', PRIO_CHAT if self.kind == 'chat' else PRIO_SYS)
+
+    @property
+    def msg(self) -> dict:
+        if self._msg is None:
+            self._msg = json.loads(self._json)
+        return self._msg
+
+    @property
+    def json(self) -> str:
+        if self._json is None:
+            self._json = json.dumps(self._msg, ensure_ascii=False)
+        return self._json
+
+    @property
+    def frame(self) -> bytes:
+        if self._frame is None:
+            prefix = f'id: {self.seq}\n' if self.seq else ''
+            self._frame = f'{prefix}data: {self.json}\n\n'.encode()
+        return self._frame
+
+    @property
+    def debug_frame(self) -> bytes:
+        """Frame com o campo 'dbg' (ms de cada estágio no servidor) para clientes ?debug=1 — também montado uma vez."""
+        if self.trace is None:
+            return self.frame
+        if self._debug_frame is None:
+            recv, parsed, rendered, enqueued = self.trace
+            dbg = {'parse': round((parsed - recv) * 1e3, 3), 'render': round((rendered - parsed) * 1e3, 3),
+                   'enqueue': round((enqueued - rendered) * 1e3, 3)}
+            data = json.dumps({**self.msg, 'dbg': dbg}, ensure_ascii=False)
+            self._debug_frame = f'id: {self.seq}\ndata: {data}\n\n'.encode()
+        return self._debug_frame
+
+
+def traced(trace: tuple | None) -> tuple | None:
+    """Acrescenta o instante atual ao trace de uma mensagem (recebido, parseado, ...). None passa direto."""
+    return trace and (*trace, time.perf_counter())
+
+
+def broadcast(msg: dict | Envelope, trace: tuple | None = None) -> Envelope:
+    """
+    Stamp msg with the next sequence id and enqueue it for all connected SSE clients. Returns the shared envelope.
+    trace = (recebido, parseado, renderizado) em perf_counter — o broadcast fecha com o estágio enqueue.
+    """
+    global _seq, deliveries_total
+    env = msg if isinstance(msg, Envelope) else Envelope(msg)
+    if env.seq is None:
+        _seq += 1
+        env.seq = _seq
+        env.msg['id'] = _seq
+        env.msg['ts'] = int(time.time() * 1000)  # horário do broadcast (ms) — o replay usa pra manter o ritmo
+    key = (env.kind, env.platform)
+    frames_total[key] = frames_total.get(key, 0) + 1
+    t0 = time.perf_counter()
+    targets = [c for c in clients if c.wants(env)]
+    stalled = [c for c in targets if not c.push(env)]
+    t1 = time.perf_counter()
+    broadcast_seconds.observe(t1 - t0)
+    deliveries_total += len(targets)
+    if trace is not None:
+        recv, parsed, rendered = trace
+        env.trace = (recv, parsed, rendered, t1)
+        latency['parse'].observe(parsed - recv)
+        latency['render'].observe(rendered - parsed)
+        latency['enqueue'].observe(t1 - rendered)
+    for c in stalled:
+        # Buffer cheio há mais de SSE_STALL_TIMEOUT sem nenhuma escrita — consumidor travado de vez
+        clients.discard(c)
+        log('sse', 'WARN', f'{c.name} travado há {SSE_STALL_TIMEOUT}s ({c.dropped} descartadas) — desconectando')
+        c.close(abort=True, reason='stalled')
+    if _workers:
+        _feed_frame(env)
+    return env
+
+
+def replay_frames(last_id: int | None, fallback: bool, wants=None) -> bytes:
+    """
+    Frames do cache de replay posteriores a last_id (Last-Event-ID), filtrados por wants(env).
+    Se o gap for mais antigo que o cache (ou sem last_id), manda o cache inteiro quando fallback, senão nada.
+    """
+    tail = list(_replay_tail)
+    start = 0
+    if last_id is not None and 0 <= last_id <= _seq and (
+            len(tail) < HISTORY_REPLAY or (tail and (tail[0].seq or 0) <= last_id)):
+        start = bisect_right(tail, last_id, key=lambda env: env.seq or 0)
+    elif not fallback:
+        return b''
+    return b''.join(env.frame for env in tail[start:] if wants is None or wants(env))
+
+
+def save_message(msg: dict | Envelope):
+    """Enqueue a chat message for the history writer task (never blocks the ingest loops)."""
+    env = msg if isinstance(msg, Envelope) else Envelope(msg)
+    _replay_tail.append(env)
+    if HISTORY_PERSIST:  # replay: a mensagem já está no histórico (e no /history) — só vai pro cache de reconexão
+        index_message(env)
+        _history_queue.put_nowait(env)
+
+
+async def history_writer_loop():
+    """Única task que escreve no histórico: junta lotes da fila e entrega ao backend (_store) numa thread."""
+    global history_errors_total
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            batch, stop = await _next_history_batch(loop)
+            if batch:
+                try:
+                    oldest = await asyncio.to_thread(_store.write, batch)
+                    if oldest:
+                        trim_history_index(oldest)
+                except Exception as e:
+                    history_errors_total += 1
+                    log('hist', 'ERROR', f'falha ao gravar lote ({len(batch)} msgs perdidas): {type(e).__name__}: {e}')
+            if stop:
+                return
+    finally:
+        _store.close()
+
+
+async def _next_history_batch(loop) -> tuple[list[Envelope], bool]:
+    """Espera a primeira mensagem e junta mais até HISTORY_BATCH mensagens ou HISTORY_BATCH_MS. None na fila = encerrar."""
+    first = await _history_queue.get()
+    if first is None:
+        return [], True
+    batch = [first]
+    deadline = loop.time() + HISTORY_BATCH_MS / 1000
+    while len(batch) < HISTORY_BATCH:
+        if _history_queue.empty():
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                env = await asyncio.wait_for(_history_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+        else:
+            env = _history_queue.get_nowait()
+        if env is None:
+            return batch, True
+        batch.append(env)
+    return batch, False
+
+
+def _seg_path(n: int) -> Path:
+    return HISTORY_DIR / f'seg-{n:06d}.jsonl'
+
+
+def _write_chunk(f, path: Path, envs: list[Envelope]):
+    """
+    Escreve as mensagens no segmento, reabrindo o handle só quando o segmento muda.
+    Retorna (handle, offset em bytes de cada linha gravada, tamanho do segmento depois do write).
+    """
+    if f is not None and f.name != str(path):
+        f.close()
+        f = None
+    if f is None:
+        f = open(path, 'ab')
+    data = [(env.json + '\n').encode() for env in envs]
+    offsets, pos = [], f.tell()
+    for d in data:
+        offsets.append(pos)
+        pos += len(d)
+    f.write(b''.join(data))
+    if HISTORY_SYNC != 'none':
+        f.flush()
+        if HISTORY_SYNC == 'fsync':
+            os.fsync(f.fileno())
+    return f, offsets, pos
+
+
+def _write_manifest():
+    tmp = HISTORY_MANIFEST.with_suffix('.tmp')
+    tmp.write_text(json.dumps({'segments': _segments}), encoding='utf-8')
+    os.replace(tmp, HISTORY_MANIFEST)
+
+
+def _commit_segments(dropped: list[int]):
+    """Grava o manifest e só então apaga os segmentos descartados."""
+    _write_manifest()
+    for n in dropped:
         try:
-            while not q.empty():
-                q.get_nowait()
-            q.put_nowait(None)
-        except Exception:
+            _seg_path(n).unlink()
+        except OSError:
             pass
 
 
-async def save_message(msg: dict):
-    """Append a chat message as one NDJSON line, keeping at most HISTORY_LIMIT lines."""
-    global _msg_count
-    line = json.dumps(msg, ensure_ascii=False) + '\n'
-    async with _history_lock:
-        await asyncio.to_thread(_append_line, line)
-        _msg_count += 1
-        if _msg_count > HISTORY_LIMIT:
-            await asyncio.to_thread(_trim_history, HISTORY_TRIM)
-            _msg_count -= HISTORY_TRIM
-            log('hist', 'WARN', f'limite atingido — {HISTORY_TRIM} mensagens antigas removidas (total: {_msg_count})')
+def _segment_lines(n: int, start: int = 0) -> list[tuple[int, str]]:
+    """(offset em bytes, linha) de cada linha do segmento a partir do byte start."""
+    try:
+        with open(_seg_path(n), 'rb') as f:
+            f.seek(start)
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    out, pos = [], start
+    for raw in data.split(b'\n'):
+        line = raw.strip()
+        if line:
+            out.append((pos, line.decode('utf-8', 'replace')))
+        pos += len(raw) + 1
+    return out
+
+
+def _truncate_torn(n: int):
+    """
+    Corta a última linha do segmento se ela não termina em quebra de linha (queda no meio de um write):
+    o próximo lote seria emendado nela e estragaria as duas mensagens. Lê só o fim do arquivo, de trás pra frente.
+    """
+    try:
+        f = open(_seg_path(n), 'rb+')
+    except FileNotFoundError:
+        return
+    with f:
+        end = pos = f.seek(0, os.SEEK_END)
+        while pos > 0:
+            start = max(pos - 4096, 0)
+            f.seek(start)
+            i = f.read(pos - start).rfind(b'\n')
+            if i >= 0:
+                pos = start + i + 1
+                break
+            pos = start
+        if pos < end:
+            f.truncate(pos)
+            log('hist', 'WARN', f'{_seg_path(n).name}: linha incompleta no fim descartada ({end - pos} bytes)')
+
+
+def _meta_path() -> Path:
+    return HISTORY_DIR / 'meta.json'
 
 
-def _append_line(line: str):
-    with open(HISTORY_FILE, 'a', encoding='utf-8') as f:
-        f.write(line)
+def _read_segment(n: int) -> list[str]:
+    try:
+        with open(_seg_path(n), encoding='utf-8') as f:
+            return [l.strip() for l in f if l.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def _migrate_legacy_history():
+    """Converte o messages.jsonl antigo em segmentos (roda uma vez, quando não há manifest)."""
+    _segments[:] = [[1, 0]]
+    if HISTORY_FILE.exists():
+        out = open(_seg_path(1), 'w', encoding='utf-8')
+        try:
+            with open(HISTORY_FILE, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    if _segments[-1][1] >= HISTORY_SEGMENT:
+                        out.close()
+                        _segments.append([_segments[-1][0] + 1, 0])
+                        out = open(_seg_path(_segments[-1][0]), 'w', encoding='utf-8')
+                    out.write(line + '\n')
+                    _segments[-1][1] += 1
+        finally:
+            out.close()
+        _write_manifest()
+        HISTORY_FILE.rename(HISTORY_FILE.with_name(HISTORY_FILE.name + '.migrated'))
+        log('hist', 'INFO', f'{HISTORY_FILE.name} migrado para {len(_segments)} segmento(s) em {HISTORY_DIR.name}/')
+    else:
+        _write_manifest()
+
+
+def history_envelopes(lines):
+    """Envelopes das linhas do histórico, pulando linhas cortadas/ilegíveis (ex.: crash no meio de um write)."""
+    bad = 0
+    for line in lines:
+        try:
+            yield Envelope(json_line=line)
+        except (ValueError, AttributeError):  # AttributeError: JSON válido mas não objeto
+            bad += 1
+    if bad:
+        log('hist', 'WARN', f'{bad} linha(s) ilegível(is) no histórico ignorada(s)')
 
 
-def _trim_history(n: int):
-    """Remove as primeiras n linhas do arquivo de histórico."""
-    with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        f.writelines(lines[n:])
+def load_history():
+    """Abre o backend do histórico (migra messages.jsonl / importa segmentos se preciso) e preenche o cache de replay."""
+    global _seq
+    lines = _store.open()
+    _replay_tail.clear()
+    _replay_tail.extend(history_envelopes(lines))
+    # Ids continuam acima de tudo que um cliente possa ter visto antes do restart (inclusive frames sys/status,
+    # que não vão pro histórico): o piso é o relógio em ms, a não ser que o histórico já esteja à frente.
+    last_id = max((env.seq or 0 for env in _replay_tail), default=0)
+    _seq = max(_seq, last_id, time.time_ns() // 1_000_000)
 
 
 def set_status(p: str, on: bool):
@@ -98,11 +632,620 @@ def set_status(p: str, on: bool):
 def log(platform: str, level: str, msg: str):
     """Log estruturado com timestamp. Níveis: INFO WARN ERROR CHAT."""
     ts = datetime.datetime.now().strftime('%H:%M:%S')
-    print(f'{ts} [{platform}] {level} {msg}', flush=True)
+    print(f'{ts} [{LOG_TAG}{platform}] {level} {msg}', flush=True)
+
+
+# ── Consulta do histórico (/history) ──────────────────────────────────────────
+# Índice em memória de todo o histórico retido, mantido a cada save_message: colunas por posição (id, ts,
+# linha JSON, usuário, plataforma) + posting lists de usuário, plataforma e palavra. Posições são ordinais
+# globais crescentes — a retenção só anda o início (_base) e as listas continuam ordenadas pra bisect.
+
+HISTORY_QUERY_LIMIT = 100   # mensagens por página do /history (?limit= até HISTORY_QUERY_MAX)
+HISTORY_QUERY_MAX = 1000
+HISTORY_INDEX_SWEEP = 64    # posting lists limpas por mensagem nova depois de uma rotação (custo fixo por add)
+_HTML_TEXT = re.compile(r'<img\b[^>]*?\balt="([^"]*)"[^>]*>|<[^>]*>')  # emote conta pelo nome (alt)
+_WORD = re.compile(r'\w+')
+_REL_TIME = re.compile(r'(\d+(?:\.\d+)?)([smhd])')
+_REL_UNITS = {'s': 1_000, 'm': 60_000, 'h': 3_600_000, 'd': 86_400_000}
+
+
+def message_text(html: str) -> str:
+    """Texto visível (minúsculo) de uma mensagem renderizada, com emotes pelo nome."""
+    return html_lib.unescape(_HTML_TEXT.sub(lambda m: f' {m.group(1) or ""} ', html)).lower()
+
+
+def message_words(html: str) -> set[str]:
+    return set(_WORD.findall(message_text(html)))
+
+
+class HistoryIndex:
+    __slots__ = ('_base', '_stale', 'seqs', 'tss', 'lines', 'users', 'platforms', 'by_user', 'by_platform', 'by_word')
+
+    def __init__(self):
+        self._base = 0                      # ordinal global da posição 0 das colunas
+        self._stale: list[tuple[dict, list[str]]] = []  # posting lists ainda com posições abaixo de _base
+        self.seqs: list[int] = []
+        self.tss: list[int] = []
+        self.lines: list[str] = []
+        self.users: list[str] = []
+        self.platforms: list[str] = []
+        self.by_user: dict[str, list[int]] = {}
+        self.by_platform: dict[str, list[int]] = {}
+        self.by_word: dict[str, list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    @property
+    def last_seq(self) -> int:
+        return self.seqs[-1] if self.seqs else 0
+
+    def add(self, line: str, msg: dict):
+        # ids e ts são monotônicos; linha sem id (messages.jsonl antigo, migrado) ganha o seguinte ao anterior —
+        # único, então o cursor de paginação (before/after) anda por elas também. Sem ts herda o anterior.
+        pos = self._base + len(self.lines)
+        self.seqs.append(max(msg.get('id') or self.last_seq + 1, self.last_seq))
+        self.tss.append(max(msg.get('ts') or 0, self.tss[-1] if self.tss else 0))
+        self.lines.append(line)
+        user = sys.intern(str(msg.get('user') or '').lower())
+        platform = sys.intern(str(msg.get('p') or ''))
+        self.users.append(user)
+        self.platforms.append(platform)
+        self.by_user.setdefault(user, []).append(pos)
+        self.by_platform.setdefault(platform, []).append(pos)
+        for word in message_words(msg.get('html') or ''):
+            self.by_word.setdefault(word, []).append(pos)
+        if self._stale:
+            self._sweep()
+
+    def add_env(self, env: Envelope):
+        if (env.seq or 0) > self.last_seq:  # snapshot do disco e ao vivo se sobrepõem — o id desempata
+            self.add(env.json, env.msg)
+
+    def trim_before(self, seq: int):
+        """
+        Descarta as mensagens com id < seq — segue a retenção do disco. Só as colunas são cortadas na hora;
+        as posting lists são limpas aos poucos a cada add (a consulta já ignora posições abaixo de _base).
+        """
+        n = bisect_left(self.seqs, seq)
+        if not n:
+            return
+        for col in (self.seqs, self.tss, self.lines, self.users, self.platforms):
+            del col[:n]
+        self._base += n
+        self._stale = [(postings, list(postings)) for postings in (self.by_user, self.by_platform, self.by_word)]
+
+    def _sweep(self, budget: int = HISTORY_INDEX_SWEEP):
+        while budget and self._stale:
+            postings, keys = self._stale[-1]
+            if not keys:
+                self._stale.pop()
+                continue
+            key = keys.pop()
+            budget -= 1
+            lst = postings.get(key)
+            if lst is None:
+                continue
+            cut = bisect_left(lst, self._base)
+            if cut == len(lst):
+                del postings[key]
+            elif cut:
+                del lst[:cut]
+
+    def query(self, users: frozenset | None = None, platforms: frozenset | None = None, words: list[str] | None = None,
+              since: int | None = None, until: int | None = None, after: int | None = None, before: int | None = None,
+              limit: int = HISTORY_QUERY_LIMIT, desc: bool = True) -> tuple[list[str], int | None]:
+        """
+        Linhas JSON que casam com todos os filtros, em ordem cronológica (ou inversa se desc), até limit.
+        Retorna (linhas, cursor): cursor é o id da última linha devolvida se há mais páginas, senão None.
+        since/until em ms; after/before são ids (cursor de paginação).
+        """
+        lo, hi = 0, len(self.lines)
+        if since is not None:
+            lo = max(lo, bisect_left(self.tss, since))
+        if until is not None:
+            hi = min(hi, bisect_right(self.tss, until))
+        if after is not None:
+            lo = max(lo, bisect_right(self.seqs, after))
+        if before is not None:
+            hi = min(hi, bisect_left(self.seqs, before))
+        if lo >= hi:
+            return [], None
+        lo, hi = lo + self._base, hi + self._base
+
+        def window(lst: list[int]) -> list[int]:
+            return lst[bisect_left(lst, lo):bisect_left(lst, hi)]
+
+        def union(postings: dict[str, list[int]], keys: frozenset) -> list[int]:
+            lists = [window(postings.get(k, [])) for k in keys]
+            return lists[0] if len(lists) == 1 else sorted(itertools.chain.from_iterable(lists))
+
+        # A posting list mais curta dirige a varredura; usuário/plataforma das outras posições são checados
+        # pelas colunas e palavras por bisect na posting list — nada é materializado além do driver
+        drivers = []
+        if users is not None:
+            drivers.append(('user', None, union(self.by_user, users)))
+        if platforms is not None:
+            drivers.append(('platform', None, union(self.by_platform, platforms)))
+        for word in words or ():
+            drivers.append(('word', word, window(self.by_word.get(word, []))))
+        drivers.sort(key=lambda d: len(d[2]))
+        kind, driver_word, candidates = drivers[0] if drivers else (None, None, range(lo, hi))
+        check_users = users if kind != 'user' else None
+        check_platforms = platforms if kind != 'platform' else None
+        check_words = [self.by_word.get(w, []) for w in words or () if not (kind == 'word' and w == driver_word)]
+
+        out = []
+        base = self._base
+        last = 0  # coluna da última linha devolvida
+        for pos in (reversed(candidates) if desc else candidates):
+            i = pos - base
+            if check_users is not None and self.users[i] not in check_users:
+                continue
+            if check_platforms is not None and self.platforms[i] not in check_platforms:
+                continue
+            if not all((j := bisect_left(lst, pos)) < len(lst) and lst[j] == pos for lst in check_words):
+                continue
+            if len(out) == limit:
+                return out, self.seqs[last]
+            out.append(self.lines[i])
+            last = i
+        return out, None
+
+
+history_index: HistoryIndex | None = None    # None enquanto o índice inicial é montado em background
+_index_pending: list[Envelope] | None = None  # mensagens que chegaram durante a montagem (None = sem índice)
+_index_oldest = 0                             # id mais antigo ainda no disco (última retenção)
+
+
+def index_message(env: Envelope):
+    if history_index is not None:
+        history_index.add_env(env)
+    elif _index_pending is not None:
+        _index_pending.append(env)
+
+
+def trim_history_index(oldest: int):
+    """A retenção descartou segmentos: o índice (e o dos workers) esquece o que saiu do disco."""
+    global _index_oldest
+    _index_oldest = max(_index_oldest, oldest)
+    if isinstance(history_index, HistoryIndex):
+        history_index.trim_before(_index_oldest)
+    if _workers:
+        _feed_workers(f't\t{_index_oldest}\t\n'.encode())
+
+
+def _load_history_index() -> HistoryIndex:
+    """Lê o histórico retido inteiro (roda numa thread). Linha cortada no fim do segmento ativo é ignorada."""
+    idx = HistoryIndex()
+    for line in _store.lines():
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            continue
+        idx.add(line, msg)
+    return idx
+
+
+def start_history_index() -> asyncio.Task:
+    """Passa a guardar as mensagens ao vivo e monta o índice do disco em background."""
+    global _index_pending
+    _index_pending = []
+    return asyncio.create_task(_build_history_index())
+
+
+async def _build_history_index():
+    global history_index, _index_pending
+    t0 = time.perf_counter()
+    idx = await asyncio.to_thread(_load_history_index)
+    for env in _index_pending:
+        idx.add_env(env)
+    idx.trim_before(_index_oldest)  # rotação durante a montagem
+    _index_pending = None
+    history_index = idx
+    log('hist', 'INFO', f'índice pronto: {len(idx)} mensagens, {len(idx.by_user)} usuários '
+                        f'({(time.perf_counter() - t0) * 1e3:.0f} ms)')
+
+
+def _parse_when(value: str, now_ms: int) -> int:
+    """Instante em ms: epoch em ms, relativo ao agora ('10m', '2h', '1d') ou data ISO local ('2026-05-01T20:00')."""
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    if m := _REL_TIME.fullmatch(value.lstrip('-')):
+        return now_ms - int(float(m.group(1)) * _REL_UNITS[m.group(2)])
+    return int(datetime.datetime.fromisoformat(value).timestamp() * 1000)
+
+
+async def history_handler(request: web.Request) -> web.StreamResponse:
+    """
+    GET /history — consulta o histórico inteiro retido. Filtros (todos opcionais, combinados com E):
+      user=a,b  platform=tw,ki  q=palavras  since=10m|epoch ms|ISO  until=...
+      limit=100  order=desc|asc  before=<id> / after=<id> (página seguinte vem no header Link)
+    Resposta: NDJSON, uma mensagem por linha, enviada em streaming.
+    """
+    if history_index is None:
+        return web.Response(status=503, text='índice do histórico ainda carregando', headers={'Retry-After': '1'})
+    query = request.rel_url.query
+    now_ms = int(time.time() * 1000)
+    try:
+        users = _query_set(query, 'user')
+        platforms = _query_set(query, 'platform')
+        if platforms and not platforms <= platform_status.keys():
+            raise ValueError(f'plataforma desconhecida: {",".join(sorted(platforms - platform_status.keys()))}')
+        words = sorted(set(_WORD.findall(query.get('q', '').lower()))) or None
+        since = _parse_when(query['since'], now_ms) if query.get('since') else None
+        until = _parse_when(query['until'], now_ms) if query.get('until') else None
+        after = int(query['after']) if query.get('after') else None
+        before = int(query['before']) if query.get('before') else None
+        limit = min(max(int(query.get('limit', HISTORY_QUERY_LIMIT)), 1), HISTORY_QUERY_MAX)
+        desc = query.get('order', 'desc') != 'asc'
+    except ValueError as e:
+        return web.Response(status=400, text=f'parâmetro inválido: {e}')
+
+    run_query = functools.partial(history_index.query, users and frozenset(u.lower() for u in users), platforms, words,
+                                  since, until, after, before, limit, desc)
+    # Índice em memória responde em µs–ms; no SQLite (FTS, varredura por faixa) a consulta vai pra uma thread
+    lines, cursor = await asyncio.to_thread(run_query) if isinstance(history_index, SqliteStore) else run_query()
+    headers = {'Cache-Control': 'no-cache'}
+    if cursor is not None:
+        # Cursor = id (no índice) da última linha devolvida; a próxima página continua dali no mesmo sentido
+        next_url = request.rel_url.update_query({'before' if desc else 'after': cursor})
+        headers['Link'] = f'<{next_url}>; rel="next"'
+    resp = web.StreamResponse(headers=headers)
+    resp.content_type = 'application/x-ndjson'
+    resp.charset = 'utf-8'
+    await resp.prepare(request)
+    chunk: list[str] = []
+    size = 0
+    for line in lines:
+        chunk.append(line + '\n')
+        size += len(line) + 1
+        if size >= SSE_BATCH_BYTES:
+            await resp.write(''.join(chunk).encode())
+            chunk, size = [], 0
+    if chunk:
+        await resp.write(''.join(chunk).encode())
+    await resp.write_eof()
+    return resp
+
+
+# ── Armazenamento do histórico ────────────────────────────────────────────────
+# Writer, start, índice do /history e --replay só falam com o histórico pelo backend em _store:
+#   open()      → prepara o armazenamento e devolve as últimas HISTORY_REPLAY linhas (cache de replay)
+#   write(envs) → grava um lote e aplica a retenção (bloqueante — o writer chama numa thread)
+#   lines()     → todas as linhas retidas, da mais antiga pra mais nova (não depende de open — workers usam)
+#   close()
+# 'segments' (padrão) é o NDJSON rotativo em history/; 'sqlite' é um banco em WAL que também responde o /history.
+
+class SegmentStore:
+    """
+    NDJSON em segmentos de HISTORY_SEGMENT linhas; retenção descarta segmentos inteiros.
+    O meta.json guarda o que o start precisa — linhas e bytes do segmento ativo, último id e onde começam as
+    últimas HISTORY_REPLAY linhas — então abrir não depende do tamanho do histórico: só o que foi gravado depois
+    da última atualização do meta (queda no meio da live) é relido.
+    """
+    name = 'segments'
+
+    def __init__(self):
+        self._f = None  # handle persistente do segmento ativo
+        self._tail: deque[tuple[int, int]] = deque(maxlen=HISTORY_REPLAY)  # (segmento, offset) das últimas linhas
+        self._bytes = 0                          # tamanho do segmento ativo
+        self._last_id = 0
+        self._meta_at = 0.0
+
+    def open(self) -> list[str]:
+        global _msg_count
+        HISTORY_DIR.mkdir(exist_ok=True)
+        if not HISTORY_MANIFEST.exists():
+            _migrate_legacy_history()
+        with open(HISTORY_MANIFEST, encoding='utf-8') as f:
+            _segments[:] = [list(seg) for seg in json.load(f).get('segments') or []] or [[1, 0]]
+        n = _segments[-1][0]
+        _truncate_torn(n)  # antes de contar linhas — vale pro meta e pra recontagem
+        tail = self._open_from_meta(n)
+        if tail is None:
+            # Sem meta válido: recalcula lendo o segmento ativo inteiro (e o anterior, se o cache precisar)
+            lines = _segment_lines(n)
+            _segments[-1][1] = len(lines)
+            self._bytes = lines[-1][0] + len(lines[-1][1].encode()) + 1 if lines else 0
+            tail = [(n, off, line) for off, line in lines[-HISTORY_REPLAY:]]
+            for prev, _ in reversed(_segments[:-1]):
+                if len(tail) >= HISTORY_REPLAY:
+                    break
+                tail[:0] = [(prev, off, line) for off, line in _segment_lines(prev)[-(HISTORY_REPLAY - len(tail)):]]
+            if lines:
+                log('hist', 'INFO', f'meta.json ausente ou desatualizado — recalculado ({len(lines)} msgs no segmento ativo)')
+        _msg_count = sum(count for _, count in _segments)
+        self._tail.clear()
+        self._tail.extend((seg, off) for seg, off, _ in tail)
+        lines = [line for _, _, line in tail]
+        self._last_id = self._line_id(lines[-1]) if lines else 0
+        self._write_meta()
+        return lines
+
+    def _open_from_meta(self, n: int) -> list[tuple[int, int, str]] | None:
+        """Cache de replay a partir do meta.json, ou None se ele não bate com os segmentos."""
+        try:
+            meta = json.loads(_meta_path().read_text(encoding='utf-8'))
+            size = _seg_path(n).stat().st_size if _seg_path(n).exists() else 0
+            if meta['segment'] != n or meta['bytes'] > size:
+                return None
+            tail_seg, tail_off = meta['tail']
+            numbers = [seg for seg, _ in _segments]
+            if tail_seg not in numbers:
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        # Só as linhas do cache (e as gravadas depois do último meta) são lidas
+        tail = []
+        for seg in numbers[numbers.index(tail_seg):]:
+            start = tail_off if seg == tail_seg else 0
+            tail.extend((seg, off, line) for off, line in _segment_lines(seg, start))
+        extra = sum(1 for seg, off, _ in tail if seg == n and off >= meta['bytes'])
+        known = [line for seg, off, line in tail if not (seg == n and off >= meta['bytes'])]
+        # Confere o conteúdo: a última linha conhecida tem que ser a do último id registrado
+        if meta['last_id'] and (not known or self._line_id(known[-1]) != meta['last_id']):
+            return None
+        _segments[-1][1] = meta['count'] + extra
+        self._bytes = size
+        return tail[-HISTORY_REPLAY:]
+
+    @staticmethod
+    def _line_id(line: str) -> int:
+        try:
+            return json.loads(line).get('id') or 0
+        except (ValueError, AttributeError):
+            return 0
+
+    def _write_meta(self):
+        n, count = _segments[-1]
+        tail = list(self._tail[0]) if self._tail else [n, 0]
+        meta = {'segment': n, 'count': count, 'bytes': self._bytes, 'last_id': self._last_id, 'tail': tail}
+        tmp = _meta_path().with_suffix('.tmp')
+        tmp.write_text(json.dumps(meta), encoding='utf-8')
+        os.replace(tmp, _meta_path())
+        self._meta_at = time.monotonic()
+
+    def write(self, envs: list[Envelope]) -> int | None:
+        """Grava o lote. Se a retenção descartou segmentos, retorna o id da mensagem mais antiga que ficou."""
+        global _msg_count
+        rotated = False
+        oldest = None
+        try:
+            while envs:
+                n, count = _segments[-1]
+                room = max(HISTORY_SEGMENT - count, 1)
+                chunk, envs = envs[:room], envs[room:]
+                t0 = time.perf_counter()
+                self._f, offsets, self._bytes = _write_chunk(self._f, _seg_path(n), chunk)
+                history_write_seconds.observe(time.perf_counter() - t0)
+                history_batch_size.observe(len(chunk))
+                self._tail.extend((n, off) for off in offsets)
+                self._last_id = chunk[-1].seq or self._last_id
+                _segments[-1][1] += len(chunk)
+                _msg_count += len(chunk)
+                if _segments[-1][1] >= HISTORY_SEGMENT:
+                    # Segmento cheio — abre o próximo e descarta os mais antigos inteiros (sem reescrever nada)
+                    _segments.append([n + 1, 0])
+                    self._bytes = 0
+                    rotated = True
+                    dropped = []
+                    while len(_segments) > 1 and _msg_count + HISTORY_SEGMENT > HISTORY_LIMIT:
+                        old_n, old_count = _segments.pop(0)
+                        _msg_count -= old_count
+                        dropped.append(old_n)
+                    t0 = time.perf_counter()
+                    _commit_segments(dropped)
+                    history_rotate_seconds.observe(time.perf_counter() - t0)
+                    if dropped:
+                        log('hist', 'INFO', f'{len(dropped)} segmento(s) antigo(s) removido(s) (total: {_msg_count})')
+                        oldest = self._first_id(_segments[0][0]) or oldest
+        except Exception:
+            self.close()  # reabre no próximo lote
+            raise
+        if rotated or time.monotonic() - self._meta_at >= HISTORY_META_INTERVAL:
+            self._write_meta()
+        return oldest
+
+    def _first_id(self, n: int) -> int:
+        try:
+            with open(_seg_path(n), encoding='utf-8') as f:
+                return self._line_id(f.readline())
+        except OSError:
+            return 0
+
+    def lines(self):
+        try:
+            segments = json.loads(HISTORY_MANIFEST.read_text(encoding='utf-8')).get('segments') or []
+        except (OSError, ValueError):
+            segments = []
+        for n, _ in segments:
+            yield from _read_segment(n)
+
+    def close(self):
+        if self._f:
+            try:
+                self._f.close()
+            except OSError:
+                pass
+            self._f = None
+            self._write_meta()  # encerramento limpo: o próximo start não relê nada
+
+
+_SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    id       INTEGER PRIMARY KEY,
+    ts       INTEGER,
+    platform TEXT,
+    user     TEXT,
+    text     TEXT,
+    line     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages(ts);
+CREATE INDEX IF NOT EXISTS messages_platform ON messages(platform, id);
+CREATE INDEX IF NOT EXISTS messages_user ON messages(user, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(text, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+-- Contador mantido pelos próprios inserts/deletes: o start lê um valor em vez de um count(*) da tabela inteira
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT INTO meta SELECT 'count', (SELECT count(*) FROM messages) WHERE NOT EXISTS (SELECT 1 FROM meta WHERE key = 'count');
+CREATE TRIGGER IF NOT EXISTS messages_count_ai AFTER INSERT ON messages BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'count';
+END;
+CREATE TRIGGER IF NOT EXISTS messages_count_ad AFTER DELETE ON messages BEGIN
+    UPDATE meta SET value = value - 1 WHERE key = 'count';
+END;
+'''
+_SQLITE_SYNC = {'none': 'OFF', 'flush': 'NORMAL', 'fsync': 'FULL'}
+
+
+def _sqlite_connect(path: Path, readonly: bool = False) -> 'sqlite3.Connection':
+    import sqlite3  # só com o backend sqlite — fora do caminho do start padrão
+    if readonly:
+        return sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+    return sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+
+
+class SqliteStore:
+    """
+    SQLite em WAL: inserts em lote numa transação, colunas indexadas (ts, plataforma, autor) e FTS5 do texto.
+    Retenção por quantidade (HISTORY_LIMIT) e idade (HISTORY_MAX_AGE_H) em deletes pequenos a cada lote.
+    Consultas do /history vão direto pro banco, numa conexão só de leitura (o WAL não bloqueia o writer).
+    """
+    name = 'sqlite'
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._db: 'sqlite3.Connection | None' = None  # conexão do writer
+        self._ro: 'sqlite3.Connection | None' = None  # leitura (/history, lines) — aberta sob demanda
+        self.count = 0
+
+    def open(self) -> list[str]:
+        global _msg_count
+        new = not self.path.exists()
+        self._db = _sqlite_connect(self.path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(f'PRAGMA synchronous={_SQLITE_SYNC[HISTORY_SYNC]}')
+        self._db.executescript(_SQLITE_SCHEMA)
+        if new and HISTORY_MANIFEST.exists():
+            self._import(SegmentStore().lines(), f'segmentos de {HISTORY_DIR.name}/')
+        elif new and HISTORY_FILE.exists():
+            # Direto do formato antigo (arquivo único) pro banco, sem passar por segmentos
+            with open(HISTORY_FILE, encoding='utf-8') as f:
+                self._import((line.strip() for line in f if line.strip()), HISTORY_FILE.name)
+            HISTORY_FILE.rename(HISTORY_FILE.with_name(HISTORY_FILE.name + '.migrated'))
+        self.count = _msg_count = self._db.execute("SELECT value FROM meta WHERE key = 'count'").fetchone()[0]
+        rows = self._db.execute('SELECT line FROM messages ORDER BY id DESC LIMIT ?', (HISTORY_REPLAY,)).fetchall()
+        return [line for line, in reversed(rows)]
+
+    def _import(self, lines, source: str):
+        """Primeira abertura com histórico existente (segmentos ou messages.jsonl): copia tudo pro banco (uma vez)."""
+        envs = []
+        for env in history_envelopes(lines):
+            envs.append(env)
+            if len(envs) >= 10_000:
+                self._insert(envs)
+                envs = []
+        self._insert(envs)
+        log('hist', 'INFO', f'{source} importado(s) em {self.path.name}')
+
+    def _insert(self, envs: list[Envelope]) -> int:
+        rows = []
+        for env in envs:
+            msg = env.msg
+            rows.append((msg.get('id'), msg.get('ts'), msg.get('p'), str(msg.get('user') or '').lower(),
+                         message_text(msg.get('html') or ''), env.json))
+        with self._db:
+            self._db.execute('BEGIN')
+            return self._db.executemany('INSERT OR IGNORE INTO messages (id, ts, platform, user, text, line) '
+                                        'VALUES (?, ?, ?, ?, ?, ?)', rows).rowcount
+
+    def write(self, envs: list[Envelope]):
+        global _msg_count
+        t0 = time.perf_counter()
+        self.count += self._insert(envs)
+        history_write_seconds.observe(time.perf_counter() - t0)
+        history_batch_size.observe(len(envs))
+        # Retenção incremental: no máximo HISTORY_DELETE_CHUNK linhas por lote, nunca um DELETE gigante
+        t0 = time.perf_counter()
+        deleted = 0
+        excess = min(self.count - HISTORY_LIMIT, HISTORY_DELETE_CHUNK)
+        if excess > 0:
+            deleted += self._db.execute('DELETE FROM messages WHERE id IN '
+                                        '(SELECT id FROM messages ORDER BY id LIMIT ?)', (excess,)).rowcount
+        if HISTORY_MAX_AGE_H:
+            cutoff = int(time.time() * 1000) - int(HISTORY_MAX_AGE_H * 3_600_000)
+            deleted += self._db.execute('DELETE FROM messages WHERE id IN (SELECT id FROM messages WHERE ts < ? '
+                                        'ORDER BY id LIMIT ?)', (cutoff, HISTORY_DELETE_CHUNK)).rowcount
+        if deleted:
+            self.count -= deleted
+            history_rotate_seconds.observe(time.perf_counter() - t0)
+        _msg_count = self.count
+
+    def _reader(self) -> 'sqlite3.Connection':
+        if self._ro is None:
+            self._ro = _sqlite_connect(self.path, readonly=True)
+        return self._ro
+
+    def lines(self):
+        if not self.path.exists():
+            return
+        db = _sqlite_connect(self.path, readonly=True)  # própria: pode rodar numa thread
+        try:
+            for line, in db.execute('SELECT line FROM messages ORDER BY id'):
+                yield line
+        finally:
+            db.close()
+
+    def add_env(self, env: Envelope):
+        pass  # /history consulta o banco — as linhas chegam pelo writer
+
+    def query(self, users: frozenset | None = None, platforms: frozenset | None = None, words: list[str] | None = None,
+              since: int | None = None, until: int | None = None, after: int | None = None, before: int | None = None,
+              limit: int = HISTORY_QUERY_LIMIT, desc: bool = True) -> tuple[list[str], int | None]:
+        """Mesma interface de HistoryIndex.query, em SQL (cursor = id da linha no banco)."""
+        where, args = [], []
+        for column, values in (('user', users), ('platform', platforms)):
+            if values is not None:
+                where.append(f'{column} IN ({",".join("?" * len(values))})')
+                args.extend(values)
+        for op, value in (('ts >=', since), ('ts <=', until), ('id >', after), ('id <', before)):
+            if value is not None:
+                where.append(f'{op} ?')
+                args.append(value)
+        if words:
+            where.append('id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)')
+            args.append(' '.join(f'"{w}"' for w in words))
+        sql = (f'SELECT id, line FROM messages {"WHERE " + " AND ".join(where) if where else ""} '
+               f'ORDER BY id {"DESC" if desc else "ASC"} LIMIT ?')
+        if not self.path.exists():
+            return [], None
+        rows = self._reader().execute(sql, (*args, limit + 1)).fetchall()
+        return [line for _, line in rows[:limit]], rows[limit - 1][0] if len(rows) > limit else None
+
+    def close(self):
+        for db in (self._db, self._ro):
+            if db is not None:
+                db.close()
+        self._db = self._ro = None
+
+
+def make_store(backend: str) -> SegmentStore | SqliteStore:
+    return SqliteStore(HISTORY_DB) if backend == 'sqlite' else SegmentStore()
+
+
+_store: SegmentStore | SqliteStore = SegmentStore()
 
 
 # ── Twitch emote rendering ────────────────────────────────────────────────────
 
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
 def tw_render(text: str, emotes_tag: str) -> str:
     if not emotes_tag:
         return esc(text)
@@ -115,41 +1258,56 @@ def tw_render(text: str, emotes_tag: str) -> str:
             if '-' not in pos:
                 continue
             s, e = pos.split('-')
-            reps.append({'s': int(s), 'e': int(e) + 1, 'id': id_})
+            reps.append((int(s), int(e) + 1, id_))
     if not reps:
         return esc(text)
-    reps.sort(key=lambda x: x['s'])
-    out, last = '', 0
-    for rep in reps:
-        out += esc(text[last:rep['s']])
-        alt = esc(text[rep['s']:rep['e']])
-        out += (
-            f'<img src="https://static-cdn.jtvnw.net/emoticons/v2/{rep["id"]}/default/dark/1.0" '
-            f'alt="{alt}" title="{alt}">'
-        )
-        last = rep['e']
-    return out + esc(text[last:])
+    reps.sort()
+    out, last = [], 0
+    for s, e, id_ in reps:
+        out.append(esc(text[last:s]))
+        out.append(_tw_emote_img(id_, text[s:e]))
+        last = e
+    out.append(esc(text[last:]))
+    return ''.join(out)
+
+
+@functools.lru_cache(maxsize=EMOTE_CACHE_SIZE)
+def _tw_emote_img(id_: str, name: str) -> str:
+    alt = esc(name)
+    return (
+        f'<img src="{emote_url("tw", id_)}" '
+        f'alt="{alt}" title="{alt}">'
+    )
 
 
 # ── Kick emote rendering ──────────────────────────────────────────────────────
 
+_KI_EMOTE_SPLIT = re.compile(r'(\[emote:\d+:[^\]]+\])')
+_KI_EMOTE = re.compile(r'\[emote:(\d+):([^\]]+)\]')
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
 def ki_render(text: str) -> str:
-    parts = re.split(r'(\[emote:\d+:[^\]]+\])', str(text or ''))
     result = []
-    for part in parts:
-        m = re.match(r'^\[emote:(\d+):([^\]]+)\]$', part)
+    # re.split com grupo de captura: índices ímpares são sempre os emotes
+    for i, part in enumerate(_KI_EMOTE_SPLIT.split(str(text or ''))):
+        m = _KI_EMOTE.fullmatch(part) if i % 2 else None
         if m:
-            id_, name = m.group(1), m.group(2)
-            result.append(
-                f'<img src="https://files.kick.com/emotes/{id_}/fullsize" '
-                f'alt=":{esc(name)}:" title=":{esc(name)}:" '
-                f'style="height:1.4em;vertical-align:middle;margin:0 2px;">'
-            )
-        else:
+            result.append(_ki_emote_img(m.group(1), m.group(2)))
+        elif part:
             result.append(esc(part))
     return ''.join(result)
 
 
+@functools.lru_cache(maxsize=EMOTE_CACHE_SIZE)
+def _ki_emote_img(id_: str, name: str) -> str:
+    return (
+        f'<img src="{emote_url("ki", id_)}" '
+        f'alt=":{esc(name)}:" title=":{esc(name)}:" '
+        f'style="height:1.4em;vertical-align:middle;margin:0 2px;">'
+    )
+
+
 # ── YouTube runs rendering ────────────────────────────────────────────────────
 
 def yt_parse_runs(runs: list) -> str:
@@ -162,25 +1320,236 @@ def yt_parse_runs(runs: list) -> str:
             url = ((emoji.get('image') or {}).get('thumbnails') or [{}])[0].get('url', '')
             name = ((emoji.get('shortcuts') or []) or [emoji.get('emojiId', '')])[0].replace(':', '')
             if url:
-                parts.append(
-                    f'<img src="{url}" alt="{esc(name)}" title="{esc(name)}" '
-                    f'style="height:1.4em;vertical-align:middle;margin:0 2px;">'
-                )
+                parts.append(_yt_emoji_img(url, name))
             elif name:
                 parts.append(esc(name))
     return ''.join(parts)
 
 
+@functools.lru_cache(maxsize=EMOTE_CACHE_SIZE)
+def _yt_emoji_img(url: str, name: str) -> str:
+    return (
+        f'<img src="{emote_url("yt", url)}" alt="{esc(name)}" title="{esc(name)}" '
+        f'style="height:1.4em;vertical-align:middle;margin:0 2px;">'
+    )
+
+
+def render_cache_stats() -> dict[str, dict[str, int]]:
+    """Hits/misses/tamanho de cada cache de renderização."""
+    caches = {
+        'tw_render': tw_render, 'ki_render': ki_render,
+        'tw_emote': _tw_emote_img, 'ki_emote': _ki_emote_img, 'yt_emoji': _yt_emoji_img,
+    }
+    return {name: fn.cache_info()._asdict() for name, fn in caches.items()}
+
+
 # ── Twitch IRC helpers ────────────────────────────────────────────────────────
 
-def _tw_tags(line: str) -> dict:
-    raw = re.match(r'^@([^ ]+)', line)
-    if not raw:
-        return {}
-    return dict(
-        t.split('=', 1) if '=' in t else (t, '')
-        for t in raw.group(1).split(';')
+class IrcMessage(NamedTuple):
+    tags: dict[str, str]
+    prefix: str
+    command: str
+    params: list[str]
+    trailing: str | None  # parâmetro final (depois de " :"), None se não veio
+
+
+_IRC_TAG_ESCAPES = {':': ';', 's': ' ', '\\': '\\', 'r': '\r', 'n': '\n'}
+
+
+def _irc_unescape(value: str) -> str:
+    """Desfaz o escape de valores de tag IRCv3 (\\s → espaço, \\: → ; etc.)."""
+    if '\\' not in value:
+        return value
+    out, i, n = [], 0, len(value)
+    while i < n:
+        c = value[i]
+        if c == '\\':
+            i += 1
+            if i < n:  # barra solta no fim é descartada
+                out.append(_IRC_TAG_ESCAPES.get(value[i], value[i]))
+        else:
+            out.append(c)
+        i += 1
+    return ''.join(out)
+
+
+def parse_irc(line: str) -> IrcMessage:
+    """Parser IRCv3 de uma passada: @tags :prefixo COMANDO params :trailing."""
+    tags: dict[str, str] = {}
+    prefix = ''
+    pos = 0
+    if line.startswith('@'):
+        end = line.find(' ')
+        if end == -1:
+            end = len(line)
+        raw = line[1:end]
+        for tag in raw.split(';'):
+            key, _, value = tag.partition('=')
+            tags[key] = value
+        if '\\' in raw:  # escape é raro (system-msg) — só então visita os valores
+            for key, value in tags.items():
+                tags[key] = _irc_unescape(value)
+        pos = end + 1
+    if line.startswith(':', pos):
+        end = line.find(' ', pos)
+        if end == -1:
+            end = len(line)
+        prefix = line[pos + 1:end]
+        pos = end + 1
+    trailing = None
+    end = line.find(' :', pos)
+    if end != -1:
+        trailing = line[end + 2:]
+        middle = line[pos:end]
+    else:
+        middle = line[pos:]
+    parts = middle.split()
+    return IrcMessage(tags, prefix, parts[0] if parts else '', parts[1:], trailing)
+
+
+def _tw_channel(irc: IrcMessage, pos: int = 0) -> str:
+    """Rótulo do canal citado em params[pos] ('#canal')."""
+    name = irc.params[pos].lstrip('#').lower() if len(irc.params) > pos else ''
+    return CHANNELS['tw'].get(name, name)
+
+
+def _tw_handle(irc: IrcMessage, trace: tuple | None = None) -> str | None:
+    """
+    Despacha uma mensagem IRC da Twitch pelo comando. Retorna o canal quando o JOIN dele terminou (366).
+    trace = (recebido, parseado) da linha, para a latência por estágio.
+    """
+    cmd = irc.command
+    if cmd == 'PRIVMSG':
+        if irc.trailing:
+            tags = irc.tags
+            user = tags.get('display-name') or 'Anônimo'
+            ch = _tw_channel(irc)
+            rendered = tw_render(irc.trailing, tags.get('emotes', ''))
+            trace = traced(trace)
+            chat_msg = {'p': 'tw', 'ch': ch, 'user': user, 'color': tags.get('color') or '', 'html': rendered}
+            log('tw', 'CHAT', f'#{ch} {user}: {irc.trailing[:80]}')
+            save_message(broadcast(chat_msg, trace))
+    elif cmd == 'USERNOTICE':
+        ch = _tw_channel(irc)
+        u = irc.tags.get('display-name') or 'Alguém'
+        msg_id = irc.tags.get('msg-id') or ''
+        if msg_id in ('sub', 'resub'):
+            log('tw', 'INFO', f'sub: {u}')
+            broadcast({'p': 'sys', 'platform': 'tw', 'ch': ch, 'prio': PRIO_EVENT, 'text': f'🟣 {u} assinou na Twitch!'})
+        elif msg_id in ('subgift', 'anonsubgift'):
+            log('tw', 'INFO', f'subgift de {u}')
+            broadcast({'p': 'sys', 'platform': 'tw', 'ch': ch, 'prio': PRIO_EVENT, 'text': f'🟣 {u} deu um sub na Twitch!'})
+        elif msg_id == 'raid':
+            viewers = irc.tags.get('msg-param-viewerCount', '?')
+            log('tw', 'INFO', f'raid de {u} ({viewers} viewers)')
+            broadcast({'p': 'sys', 'platform': 'tw', 'ch': ch, 'prio': PRIO_EVENT, 'text': f'🟣 Raid de {u} — {viewers} viewers!'})
+    elif cmd == '366':  # RPL_ENDOFNAMES — JOIN concluído (params: nick, #canal)
+        return _tw_channel(irc, 1)
+    elif cmd == 'NOTICE':
+        if irc.trailing:
+            log('tw', 'WARN', f'notice: {irc.trailing}')
+    elif cmd in ('403', '406'):  # ERR_NOSUCHCHANNEL / ERR_WASNOSUCHNICK
+        log('tw', 'ERROR', f'canal inválido ou inexistente: {_tw_channel(irc, 1)}')
+    return None
+
+
+# ── Cliente HTTP compartilhado ────────────────────────────────────────────────
+# Uma ClientSession para o processo inteiro, aberta no main(): os loops de plataforma e o proxy de emotes
+# pegam emprestado em vez de criar a sua a cada reconexão. O connector guarda o cache de DNS e as conexões
+# keep-alive, então reconectar depois de uma queda não refaz resolução nem handshake TLS para os polls.
+
+WS_TIMEOUT = ClientTimeout(total=None, connect=15, sock_connect=15)  # WS vive indefinidamente; só o connect tem teto
+
+_http: ClientSession | None = None
+# Por host: conexões novas vs. reusadas do pool, misses do cache de DNS e tempo de abrir conexão (TCP + TLS)
+http_hosts: dict[str, dict] = {}
+# Por link ('tw', 'ki', 'yt/<video>'): conexões, último handshake e quanto tempo ficou fora até reconectar
+link_stats: dict[str, dict] = {}
+
+
+def _host_stats(ctx) -> dict:
+    return http_hosts.setdefault(ctx.host, {'new': 0, 'reused': 0, 'dns_miss': 0, 'connect_ms': 0.0, 'connect_ms_max': 0.0})
+
+
+async def _on_request_start(session, ctx, params):
+    ctx.host = params.url.host or '?'
+
+
+async def _on_connection_create_start(session, ctx, params):
+    ctx.t0 = time.perf_counter()
+
+
+async def _on_connection_create_end(session, ctx, params):
+    st = _host_stats(ctx)
+    ms = (time.perf_counter() - ctx.t0) * 1e3
+    st['new'] += 1
+    st['connect_ms'] = ms
+    st['connect_ms_max'] = max(st['connect_ms_max'], ms)
+
+
+async def _on_connection_reuseconn(session, ctx, params):
+    _host_stats(ctx)['reused'] += 1
+
+
+async def _on_dns_cache_miss(session, ctx, params):
+    _host_stats(ctx)['dns_miss'] += 1
+
+
+def _http_trace() -> TraceConfig:
+    trace = TraceConfig()
+    trace.on_request_start.append(_on_request_start)
+    trace.on_connection_create_start.append(_on_connection_create_start)
+    trace.on_connection_create_end.append(_on_connection_create_end)
+    trace.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace.on_dns_cache_miss.append(_on_dns_cache_miss)
+    return trace
+
+
+def open_http() -> ClientSession:
+    global _http
+    connector = TCPConnector(
+        limit=HTTP_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE,
     )
+    _http = ClientSession(connector=connector, timeout=WS_TIMEOUT, trace_configs=[_http_trace()])
+    return _http
+
+
+def http_session() -> ClientSession:
+    """A session compartilhada. Abre sob demanda se o main() ainda não abriu (ex: bench, scripts)."""
+    if _http is None or _http.closed:
+        return open_http()
+    return _http
+
+
+async def close_http():
+    if _http is not None and not _http.closed:
+        await _http.close()
+
+
+def _link(name: str) -> dict:
+    return link_stats.setdefault(name, {'connects': 0, 'handshake_ms': 0.0, 'reconnect_s': 0.0, 'down_since': None})
+
+
+def link_up(name: str, handshake: float) -> str:
+    """Registra conexão estabelecida (handshake em s). Retorna o trecho de log com os tempos."""
+    st = _link(name)
+    st['connects'] += 1
+    st['handshake_ms'] = handshake * 1e3
+    info = f'handshake {handshake * 1e3:.0f} ms'
+    if st['down_since'] is not None:
+        st['reconnect_s'] = time.monotonic() - st['down_since']
+        st['down_since'] = None
+        info += f', fora por {st["reconnect_s"]:.1f}s'
+    return info
+
+
+def link_down(name: str):
+    st = _link(name)
+    if st['down_since'] is None:
+        st['down_since'] = time.monotonic()
 
 
 # ── Twitch IRC loop ───────────────────────────────────────────────────────────
@@ -192,73 +1561,45 @@ async def twitch_loop():
     while True:
         attempt += 1
         connected = False
-        log('tw', 'INFO', f'conectando (tentativa #{attempt}) → wss://irc-ws.chat.twitch.tv')
+        log('tw', 'INFO', f'conectando (tentativa #{attempt}) → {TW_IRC_URL}')
         try:
-            conn_timeout = ClientTimeout(total=None, connect=15, sock_connect=15)
-            async with ClientSession(timeout=conn_timeout) as session:
-                async with session.ws_connect(
-                    'wss://irc-ws.chat.twitch.tv:443',
-                    heartbeat=30,  # WS ping automático; reconecta se sem pong em 30s
-                ) as ws:
-                    await ws.send_str('CAP REQ :twitch.tv/tags twitch.tv/commands')
-                    await ws.send_str(f'NICK justinfan{10000 + randint(0, 89999)}')
-                    await ws.send_str(f'JOIN #{TW_CH}')
-                    async for msg in ws:
-                        if msg.type == WSMsgType.TEXT:
-                            for line in msg.data.split('\r\n'):
-                                if not line:
-                                    continue
-                                if line.startswith('PING'):
-                                    await ws.send_str('PONG :tmi.twitch.tv')
-                                    continue
-                                if 'End of /NAMES list' in line:
-                                    connected = True
-                                    backoff = 5
-                                    set_status('tw', True)
-                                    broadcast({'p': 'sys', 'text': f'🟣 Twitch conectado — #{TW_CH}'})
-                                    log('tw', 'INFO', f'conectado — #{TW_CH}')
-                                elif 'USERNOTICE' in line:
-                                    tags = _tw_tags(line)
-                                    u = tags.get('display-name') or 'Alguém'
-                                    msg_id = tags.get('msg-id') or ''
-                                    if msg_id in ('sub', 'resub'):
-                                        log('tw', 'INFO', f'sub: {u}')
-                                        broadcast({'p': 'sys', 'text': f'🟣 {u} assinou na Twitch!'})
-                                    elif msg_id in ('subgift', 'anonsubgift'):
-                                        log('tw', 'INFO', f'subgift de {u}')
-                                        broadcast({'p': 'sys', 'text': f'🟣 {u} deu um sub na Twitch!'})
-                                    elif msg_id == 'raid':
-                                        viewers = tags.get('msg-param-viewerCount', '?')
-                                        log('tw', 'INFO', f'raid de {u} ({viewers} viewers)')
-                                        broadcast({'p': 'sys', 'text': f'🟣 Raid de {u} — {viewers} viewers!'})
-                                elif 'PRIVMSG' in line:
-                                    tags = _tw_tags(line)
-                                    user = tags.get('display-name') or 'Anônimo'
-                                    color = tags.get('color') or ''
-                                    m = re.search(r'PRIVMSG #\S+ :(.+)$', line)
-                                    if m:
-                                        rendered = tw_render(m.group(1), tags.get('emotes', ''))
-                                        chat_msg = {'p': 'tw', 'user': user, 'color': color, 'html': rendered}
-                                        log('tw', 'CHAT', f'{user}: {m.group(1)[:80]}')
-                                        broadcast(chat_msg)
-                                        await save_message(chat_msg)
-                                elif 'NOTICE' in line:
-                                    m_notice = re.search(r'NOTICE \S+ :(.+)$', line)
-                                    if m_notice:
-                                        log('tw', 'WARN', f'notice: {m_notice.group(1)}')
-                                elif re.search(r' 40[36] ', line):
-                                    log('tw', 'ERROR', f'canal inválido ou inexistente: {TW_CH}')
-                        elif msg.type == WSMsgType.ERROR:
-                            log('tw', 'WARN', f'erro no WebSocket: {ws.exception()}')
-                            break
-                        elif msg.type == WSMsgType.CLOSED:
-                            log('tw', 'WARN', f'WebSocket fechado pelo servidor (código {ws.close_code})')
-                            break
+            t0 = time.perf_counter()
+            async with http_session().ws_connect(
+                TW_IRC_URL,
+                heartbeat=30,  # WS ping automático; reconecta se sem pong em 30s
+            ) as ws:
+                await ws.send_str('CAP REQ :twitch.tv/tags twitch.tv/commands')
+                await ws.send_str(f'NICK justinfan{10000 + randint(0, 89999)}')
+                # Um JOIN só pra todos os canais do registro — tudo na mesma conexão
+                await ws.send_str('JOIN ' + ','.join(f'#{name}' for name in CHANNELS['tw']))
+                async for msg in ws:
+                    if msg.type == WSMsgType.TEXT:
+                        recv = time.perf_counter()
+                        for line in msg.data.split('\r\n'):
+                            if not line:
+                                continue
+                            irc = parse_irc(line)
+                            if irc.command == 'PING':
+                                await ws.send_str(f'PONG :{irc.trailing or "tmi.twitch.tv"}')
+                            elif joined := _tw_handle(irc, (recv, time.perf_counter())):
+                                timing = link_up('tw', time.perf_counter() - t0) if not connected else ''
+                                connected = True
+                                backoff = RECONNECT_MIN
+                                set_status('tw', True)
+                                broadcast({'p': 'sys', 'platform': 'tw', 'ch': joined, 'text': f'🟣 Twitch conectado — #{joined}'})
+                                log('tw', 'INFO', f'conectado — #{joined}' + (f' ({timing})' if timing else ''))
+                    elif msg.type == WSMsgType.ERROR:
+                        log('tw', 'WARN', f'erro no WebSocket: {ws.exception()}')
+                        break
+                    elif msg.type == WSMsgType.CLOSED:
+                        log('tw', 'WARN', f'WebSocket fechado pelo servidor (código {ws.close_code})')
+                        break
         except asyncio.CancelledError:
             raise
         except Exception as e:
             log('tw', 'ERROR', f'{type(e).__name__}: {e}')
         set_status('tw', False)
+        link_down('tw')
         if not connected:
             backoff = min(backoff * 2, 60)
         log('tw', 'WARN', f'desconectado — reconectando em {backoff}s...')
@@ -273,101 +1614,105 @@ async def kick_loop():
     while True:
         attempt += 1
         connected = False
-        pusher_url = (
-            f'wss://ws-{PUSHER_CLUSTER}.pusher.com/app/{PUSHER_KEY}'
-            f'?protocol=7&client=py&version=7.6.0'
-        )
-        log('ki', 'INFO', f'conectando (tentativa #{attempt}) → ws-{PUSHER_CLUSTER}.pusher.com')
+        log('ki', 'INFO', f'conectando (tentativa #{attempt}) → {urlsplit(KI_PUSHER_URL).netloc}')
         try:
-            conn_timeout = ClientTimeout(total=None, connect=15, sock_connect=15)
-            async with ClientSession(timeout=conn_timeout) as session:
-                async with session.ws_connect(
-                    pusher_url,
-                    heartbeat=30,  # WS ping automático como backup ao pusher:ping
-                ) as ws:
-                    async for msg in ws:
-                        if msg.type == WSMsgType.TEXT:
-                            event = json.loads(msg.data)
-                            ename = event.get('event', '')
-
-                            if ename == 'pusher:connection_established':
-                                sock_id = (json.loads(event.get('data') or '{}') or {}).get('socket_id', '?')
-                                log('ki', 'INFO', f'Pusher estabelecido (socket_id={sock_id}) — subscrevendo chatroom {KI_CHATROOM_ID}')
-                                sub = json.dumps({
+            t0 = time.perf_counter()
+            async with http_session().ws_connect(
+                KI_PUSHER_URL,
+                heartbeat=30,  # WS ping automático como backup ao pusher:ping
+            ) as ws:
+                async for msg in ws:
+                    if msg.type == WSMsgType.TEXT:
+                        recv = time.perf_counter()
+                        event = json.loads(msg.data)
+                        ename = event.get('event', '')
+
+                        # 'chatrooms.<id>.v2' → canal do registro (cada chatroom é uma inscrição no mesmo socket)
+                        room = (event.get('channel') or '').removeprefix('chatrooms.').removesuffix('.v2')
+                        ch = CHANNELS['ki'].get(room, room)
+
+                        if ename == 'pusher:connection_established':
+                            sock_id = (json.loads(event.get('data') or '{}') or {}).get('socket_id', '?')
+                            rooms = ', '.join(CHANNELS['ki'])
+                            log('ki', 'INFO', f'Pusher estabelecido (socket_id={sock_id}) — subscrevendo chatroom(s) {rooms}')
+                            for room_id in CHANNELS['ki']:
+                                await ws.send_str(json.dumps({
                                     'event': 'pusher:subscribe',
-                                    'data': {'channel': f'chatrooms.{KI_CHATROOM_ID}.v2'}
-                                })
-                                await ws.send_str(sub)
-
-                            elif ename == 'pusher_internal:subscription_succeeded':
-                                connected = True
-                                backoff = 5
-                                set_status('ki', True)
-                                broadcast({'p': 'sys', 'text': f'🟢 Kick conectado — {KI_CH}'})
-                                log('ki', 'INFO', f'conectado — {KI_CH} (chatroom {KI_CHATROOM_ID})')
-
-                            elif ename == 'pusher:error':
-                                d = event.get('data') or {}
-                                if isinstance(d, str):
-                                    try:
-                                        d = json.loads(d)
-                                    except Exception:
-                                        pass
-                                code = d.get('code') if isinstance(d, dict) else None
-                                errmsg = d.get('message', d) if isinstance(d, dict) else d
-                                if code and 4000 <= int(code) < 4100:
-                                    # Erros de aplicação Pusher (chave inválida, etc.) — log proeminente
-                                    log('ki', 'ERROR', f'Pusher erro fatal (código {code}): {errmsg}')
-                                else:
-                                    log('ki', 'WARN', f'Pusher erro (código {code}): {errmsg}')
-
-                            elif ename == 'pusher:ping':
-                                await ws.send_str(json.dumps({'event': 'pusher:pong', 'data': {}}))
-
-                            elif ename == 'App\\Events\\ChatMessageEvent':
-                                d = event.get('data')
-                                if isinstance(d, str):
+                                    'data': {'channel': f'chatrooms.{room_id}.v2'}
+                                }))
+
+                        elif ename == 'pusher_internal:subscription_succeeded':
+                            timing = link_up('ki', time.perf_counter() - t0) if not connected else ''
+                            connected = True
+                            backoff = RECONNECT_MIN
+                            set_status('ki', True)
+                            broadcast({'p': 'sys', 'platform': 'ki', 'ch': ch, 'text': f'🟢 Kick conectado — {ch}'})
+                            log('ki', 'INFO', f'conectado — {ch} (chatroom {room})' + (f' ({timing})' if timing else ''))
+
+                        elif ename == 'pusher:error':
+                            d = event.get('data') or {}
+                            if isinstance(d, str):
+                                try:
                                     d = json.loads(d)
-                                sender = d.get('sender') or {}
-                                user = sender.get('username') or sender.get('slug') or 'Anônimo'
-                                color = (sender.get('identity') or {}).get('color') or ''
-                                text = d.get('content') or ''
-                                if text:
-                                    chat_msg = {'p': 'ki', 'user': user, 'color': color, 'html': ki_render(text)}
-                                    log('ki', 'CHAT', f'{user}: {text[:80]}')
-                                    broadcast(chat_msg)
-                                    await save_message(chat_msg)
-
-                            elif ename == 'App\\Events\\SubscriptionEvent':
-                                d = event.get('data')
-                                if isinstance(d, str):
-                                    d = json.loads(d)
-                                who = (d or {}).get('username', 'Alguém')
-                                log('ki', 'INFO', f'sub: {who}')
-                                broadcast({'p': 'sys', 'text': f'🟢 {who} assinou no Kick!'})
-
-                            elif ename == 'App\\Events\\GiftedSubscriptionsEvent':
-                                d = event.get('data')
-                                if isinstance(d, str):
-                                    d = json.loads(d)
-                                d = d or {}
-                                gifted_by = d.get('gifted_by') or 'Alguém'
-                                count = len(d.get('gifted_usernames') or []) or 1
-                                log('ki', 'INFO', f'gifted subs: {gifted_by} → {count} sub(s)')
-                                broadcast({'p': 'sys', 'text': f'🟢 {gifted_by} deu {count} sub(s) no Kick!'})
-
-                        elif msg.type == WSMsgType.ERROR:
-                            log('ki', 'WARN', f'erro no WebSocket: {ws.exception()}')
-                            break
-                        elif msg.type == WSMsgType.CLOSED:
-                            log('ki', 'WARN', f'WebSocket fechado pelo servidor (código {ws.close_code})')
-                            break
+                                except Exception:
+                                    pass
+                            code = d.get('code') if isinstance(d, dict) else None
+                            errmsg = d.get('message', d) if isinstance(d, dict) else d
+                            if code and 4000 <= int(code) < 4100:
+                                # Erros de aplicação Pusher (chave inválida, etc.) — log proeminente
+                                log('ki', 'ERROR', f'Pusher erro fatal (código {code}): {errmsg}')
+                            else:
+                                log('ki', 'WARN', f'Pusher erro (código {code}): {errmsg}')
+
+                        elif ename == 'pusher:ping':
+                            await ws.send_str(json.dumps({'event': 'pusher:pong', 'data': {}}))
+
+                        elif ename == 'App\\Events\\ChatMessageEvent':
+                            d = event.get('data')
+                            if isinstance(d, str):
+                                d = json.loads(d)
+                            parsed = time.perf_counter()
+                            sender = d.get('sender') or {}
+                            user = sender.get('username') or sender.get('slug') or 'Anônimo'
+                            color = (sender.get('identity') or {}).get('color') or ''
+                            text = d.get('content') or ''
+                            if text:
+                                chat_msg = {'p': 'ki', 'ch': ch, 'user': user, 'color': color, 'html': ki_render(text)}
+                                trace = (recv, parsed, time.perf_counter())
+                                log('ki', 'CHAT', f'{ch} {user}: {text[:80]}')
+                                save_message(broadcast(chat_msg, trace))
+
+                        elif ename == 'App\\Events\\SubscriptionEvent':
+                            d = event.get('data')
+                            if isinstance(d, str):
+                                d = json.loads(d)
+                            who = (d or {}).get('username', 'Alguém')
+                            log('ki', 'INFO', f'sub: {who}')
+                            broadcast({'p': 'sys', 'platform': 'ki', 'ch': ch, 'prio': PRIO_EVENT, 'text': f'🟢 {who} assinou no Kick!'})
+
+                        elif ename == 'App\\Events\\GiftedSubscriptionsEvent':
+                            d = event.get('data')
+                            if isinstance(d, str):
+                                d = json.loads(d)
+                            d = d or {}
+                            gifted_by = d.get('gifted_by') or 'Alguém'
+                            count = len(d.get('gifted_usernames') or []) or 1
+                            log('ki', 'INFO', f'gifted subs: {gifted_by} → {count} sub(s)')
+                            broadcast({'p': 'sys', 'platform': 'ki', 'ch': ch, 'prio': PRIO_EVENT, 'text': f'🟢 {gifted_by} deu {count} sub(s) no Kick!'})
+
+                    elif msg.type == WSMsgType.ERROR:
+                        log('ki', 'WARN', f'erro no WebSocket: {ws.exception()}')
+                        break
+                    elif msg.type == WSMsgType.CLOSED:
+                        log('ki', 'WARN', f'WebSocket fechado pelo servidor (código {ws.close_code})')
+                        break
 
         except asyncio.CancelledError:
             raise
         except Exception as e:
             log('ki', 'ERROR', f'{type(e).__name__}: {e}')
         set_status('ki', False)
+        link_down('ki')
         if not connected:
             backoff = min(backoff * 2, 60)
         log('ki', 'WARN', f'desconectado — reconectando em {backoff}s...')
@@ -376,139 +1721,60 @@ async def kick_loop():
 
 # ── YouTube polling loop ──────────────────────────────────────────────────────
 
-async def youtube_loop(video_id: str):
-    if not video_id:
-        return
-
-    YT_HEADERS = {
-        'User-Agent': (
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-            'AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        ),
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Cookie': 'CONSENT=YES+1; SOCS=CAESEwgDEgk1NzM4MTkzMjYaAmVuIAE=',
-    }
-    req_timeout = ClientTimeout(total=30)
+YT_HEADERS = {
+    'User-Agent': (
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+        'AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    ),
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Cookie': 'CONSENT=YES+1; SOCS=CAESEwgDEgk1NzM4MTkzMjYaAmVuIAE=',
+}
+YT_REQ_TIMEOUT = ClientTimeout(total=30)
+
+
+class _YtVideo:
+    """Estado de polling de um vídeo: token de continuação, backoffs e hora do próximo poll."""
+    __slots__ = ('video_id', 'label', 'continuation', 'is_first', 'token_backoff', 'err_backoff', 'next_at', 'sched')
+
+    def __init__(self, video_id: str, label: str):
+        self.video_id = video_id
+        self.label = label
+        self.continuation: str | None = None
+        self.is_first = True
+        self.token_backoff = 5
+        self.err_backoff = 5
+        self.next_at = 0.0
+        self.sched = _yt_schedulers.setdefault(video_id, YtPollScheduler())
+
+
+async def youtube_loop(video_ids: list[str]):
+    """
+    Um scheduler para todos os vídeos do registro: cada vídeo tem seu estado e hora de poll,
+    e o loop atende sempre o próximo da fila — uma task só, na session compartilhada.
+    """
+    videos = {vid: _YtVideo(vid, CHANNELS['yt'].get(vid, vid)) for vid in video_ids if vid}
+    loop = asyncio.get_running_loop()
     attempt = 0
     outer_backoff = 5
 
-    while True:
+    while videos:
         attempt += 1
-        log('yt', 'INFO', f'iniciando (tentativa #{attempt}) — v={video_id}')
+        log('yt', 'INFO', f'iniciando (tentativa #{attempt}) — v={", ".join(videos)}')
 
         try:
-            # Uma session por ciclo de conexão — reutilizada entre token e polls
-            async with ClientSession() as session:
-
-                # ── Fase 1: obter token de continuação ────────────────────────────
-                continuation = None
-                token_backoff = 5
-                while not continuation:
-                    try:
-                        async with session.get(
-                            f'https://www.youtube.com/live_chat?v={video_id}&is_popout=1',
-                            headers=YT_HEADERS,
-                            timeout=req_timeout,
-                        ) as r:
-                            if r.status == 404:
-                                log('yt', 'ERROR', 'HTTP 404 — live não existe ou encerrou permanentemente')
-                                set_status('yt', False)
-                                return
-                            if not r.ok:
-                                raise Exception(f'HTTP {r.status}')
-                            html = await r.text()
-                            continuation = _yt_extract_token(html)
-                            if not continuation:
-                                raise Exception('token de continuação não encontrado na página')
-                            log('yt', 'INFO', f'token obtido: {continuation[:24]}...')
-                    except asyncio.CancelledError:
-                        raise
-                    except Exception as e:
-                        log('yt', 'ERROR', f'erro ao buscar token: {type(e).__name__}: {e} — tentando em {token_backoff}s')
-                        await asyncio.sleep(token_backoff)
-                        token_backoff = min(token_backoff * 2, 60)
-
-                set_status('yt', True)
-                broadcast({'p': 'sys', 'text': '🔴 YouTube conectado!'})
-                log('yt', 'INFO', f'conectado — iniciando polling (v={video_id})')
-
-                # ── Fase 2: polling de mensagens ──────────────────────────────────
-                is_first = True
-                rate_backoff = 0
-                err_backoff = 5
-
-                while True:
-                    try:
-                        async with session.post(
-                            'https://www.youtube.com/youtubei/v1/live_chat/get_live_chat',
-                            json={
-                                'context': {
-                                    'client': {
-                                        'clientName': 'WEB',
-                                        'clientVersion': '2.20240101.00.00',
-                                        'hl': 'en',
-                                    }
-                                },
-                                'continuation': continuation,
-                            },
-                            headers={'Content-Type': 'application/json'},
-                            timeout=req_timeout,
-                        ) as resp:
-                            if resp.status == 429:
-                                rate_backoff = min((rate_backoff or 10) * 2, 120)
-                                log('yt', 'WARN', f'429 rate-limit — aguardando {rate_backoff}s')
-                                await asyncio.sleep(rate_backoff)
-                                continue
-                            if resp.status == 404:
-                                log('yt', 'INFO', 'poll 404 — live encerrada')
-                                set_status('yt', False)
-                                broadcast({'p': 'sys', 'text': '🔴 YouTube: live encerrada.'})
-                                return
-                            if not resp.ok:
-                                raise Exception(f'HTTP {resp.status}')
-                            data = await resp.json(content_type=None)
-
-                    except asyncio.CancelledError:
-                        raise
-                    except Exception as e:
-                        if re.search(r'encerrada|ended|not.?found', str(e), re.I):
-                            log('yt', 'INFO', f'live encerrada ({e})')
-                            set_status('yt', False)
-                            broadcast({'p': 'sys', 'text': '🔴 YouTube: live encerrada.'})
-                            return
-                        log('yt', 'ERROR', f'{type(e).__name__}: {e} — tentando em {err_backoff}s')
-                        await asyncio.sleep(err_backoff)
-                        err_backoff = min(err_backoff * 2, 60)
-                        continue
-
-                    lcc = (data.get('continuationContents') or {}).get('liveChatContinuation')
-                    if not lcc:
-                        # YouTube parou de retornar continuação — reconecta do zero
-                        log('yt', 'WARN', 'liveChatContinuation ausente — reconectando do zero')
-                        break  # sai do loop de poll; outer loop re-busca o token
-
-                    nc = ((lcc.get('continuations') or [{}]))[0]
-                    tok = (
-                        (nc.get('timedContinuationData') or {}).get('continuation')
-                        or (nc.get('invalidationContinuationData') or {}).get('continuation')
-                        or (nc.get('reloadContinuationData') or {}).get('continuation')
-                    )
-                    if tok:
-                        continuation = tok
-
-                    poll_ms = (
-                        (nc.get('timedContinuationData') or {}).get('timeoutMs')
-                        or (nc.get('invalidationContinuationData') or {}).get('timeoutMs')
-                        or 5000
-                    )
-
-                    if not is_first:
-                        for action in lcc.get('actions') or []:
-                            await _yt_handle_action(action)
-                    is_first = False
-                    rate_backoff = 0
-                    err_backoff = 5
-                    await asyncio.sleep(min(poll_ms, 2000) / 1000)
+            # Session compartilhada: tokens e polls de todos os vídeos reusam as conexões keep-alive do pool
+            session = http_session()
+            while videos:
+                v = min(videos.values(), key=lambda v: v.next_at)
+                wait = v.next_at - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                if not await _yt_step(session, v, loop):
+                    del videos[v.video_id]
+                live = any(v.continuation for v in videos.values())
+                if platform_status['yt'] != live:
+                    set_status('yt', live)
+                outer_backoff = RECONNECT_MIN
 
         except asyncio.CancelledError:
             raise
@@ -516,11 +1782,197 @@ async def youtube_loop(video_id: str):
             log('yt', 'ERROR', f'erro inesperado: {type(e).__name__}: {e}')
 
         set_status('yt', False)
+        if not videos:
+            return
+        for v in videos.values():
+            if v.continuation:
+                link_down(f'yt/{v.video_id}')
+            v.continuation = None
+            v.next_at = 0.0
         log('yt', 'WARN', f'desconectado — reconectando em {outer_backoff}s...')
         await asyncio.sleep(outer_backoff)
         outer_backoff = min(outer_backoff * 2, 60)
 
 
+def _yt_tag(v: _YtVideo) -> str:
+    """Sufixo dos avisos quando há mais de um vídeo no registro."""
+    return f' ({v.label})' if len(CHANNELS['yt']) > 1 else ''
+
+
+async def _yt_step(session: ClientSession, v: _YtVideo, loop) -> bool:
+    """Um passo do vídeo v: busca o token (se falta) ou faz um poll. False = live encerrada, tirar da fila."""
+    # ── Fase 1: obter token de continuação ────────────────────────────────────
+    if not v.continuation:
+        t0 = time.perf_counter()
+        try:
+            async with session.get(
+                f'{YT_BASE_URL}/live_chat?v={v.video_id}&is_popout=1',
+                headers=YT_HEADERS,
+                timeout=YT_REQ_TIMEOUT,
+            ) as r:
+                if r.status == 404:
+                    log('yt', 'ERROR', f'HTTP 404 — live não existe ou encerrou permanentemente (v={v.video_id})')
+                    return False
+                if not r.ok:
+                    raise Exception(f'HTTP {r.status}')
+                html = await r.text()
+                continuation = _yt_extract_token(html)
+                if not continuation:
+                    raise Exception('token de continuação não encontrado na página')
+                log('yt', 'INFO', f'token obtido: {continuation[:24]}... (v={v.video_id})')
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log('yt', 'ERROR', f'erro ao buscar token: {type(e).__name__}: {e} — tentando em {v.token_backoff}s')
+            v.next_at = loop.time() + v.token_backoff
+            v.token_backoff = min(v.token_backoff * 2, 60)
+            return True
+        v.continuation = continuation
+        v.is_first = True
+        v.token_backoff = 5
+        v.next_at = loop.time()
+        timing = link_up(f'yt/{v.video_id}', time.perf_counter() - t0)
+        broadcast({'p': 'sys', 'platform': 'yt', 'ch': v.label, 'text': f'🔴 YouTube conectado!{_yt_tag(v)}'})
+        log('yt', 'INFO', f'conectado — iniciando polling (v={v.video_id}, {timing})')
+        return True
+
+    # ── Fase 2: polling de mensagens ──────────────────────────────────────────
+    try:
+        async with session.post(
+            f'{YT_BASE_URL}/youtubei/v1/live_chat/get_live_chat',
+            json={
+                'context': {
+                    'client': {
+                        'clientName': 'WEB',
+                        'clientVersion': '2.20240101.00.00',
+                        'hl': 'en',
+                    }
+                },
+                'continuation': v.continuation,
+            },
+            headers={'Content-Type': 'application/json'},
+            timeout=YT_REQ_TIMEOUT,
+        ) as resp:
+            if resp.status == 429:
+                delay = v.sched.on_rate_limit()
+                log('yt', 'WARN', f'429 rate-limit — aguardando {delay:.0f}s (v={v.video_id})')
+                v.next_at = loop.time() + delay
+                return True
+            if resp.status == 404:
+                log('yt', 'INFO', f'poll 404 — live encerrada (v={v.video_id})')
+                broadcast({'p': 'sys', 'platform': 'yt', 'ch': v.label, 'text': f'🔴 YouTube: live encerrada.{_yt_tag(v)}'})
+                return False
+            if not resp.ok:
+                raise Exception(f'HTTP {resp.status}')
+            body = await resp.read()
+        recv = time.perf_counter()
+        data = json.loads(body)
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        if re.search(r'encerrada|ended|not.?found', str(e), re.I):
+            log('yt', 'INFO', f'live encerrada ({e}) (v={v.video_id})')
+            broadcast({'p': 'sys', 'platform': 'yt', 'ch': v.label, 'text': f'🔴 YouTube: live encerrada.{_yt_tag(v)}'})
+            return False
+        log('yt', 'ERROR', f'{type(e).__name__}: {e} — tentando em {v.err_backoff}s (v={v.video_id})')
+        v.next_at = loop.time() + v.err_backoff
+        v.err_backoff = min(v.err_backoff * 2, 60)
+        return True
+
+    lcc = (data.get('continuationContents') or {}).get('liveChatContinuation')
+    if not lcc:
+        # YouTube parou de retornar continuação — re-busca o token do zero
+        log('yt', 'WARN', f'liveChatContinuation ausente — reconectando do zero (v={v.video_id})')
+        v.continuation = None
+        link_down(f'yt/{v.video_id}')
+        v.next_at = loop.time() + v.token_backoff
+        return True
+
+    nc = ((lcc.get('continuations') or [{}]))[0]
+    tok = (
+        (nc.get('timedContinuationData') or {}).get('continuation')
+        or (nc.get('invalidationContinuationData') or {}).get('continuation')
+        or (nc.get('reloadContinuationData') or {}).get('continuation')
+    )
+    if tok:
+        v.continuation = tok
+
+    poll_ms = (
+        (nc.get('timedContinuationData') or {}).get('timeoutMs')
+        or (nc.get('invalidationContinuationData') or {}).get('timeoutMs')
+        or 5000
+    )
+
+    actions = lcc.get('actions') or []
+    delay = None
+    if not v.is_first:
+        now_us = time.time() * 1e6
+        trace = (recv, time.perf_counter())
+        for action in actions:
+            ts = _yt_handle_action(action, v.label, trace)
+            if ts:
+                delay = max(delay or 0, (now_us - ts) / 1e6)
+    v.sched.on_poll(poll_ms, 0 if v.is_first else len(actions), delay)
+    v.is_first = False
+    v.err_backoff = 5
+    v.next_at = loop.time() + v.sched.next_delay()
+    return True
+
+
+class YtPollScheduler:
+    """
+    Intervalo de polling do chat do YouTube. Parte do timeoutMs que o YouTube devolve e ajusta por
+    velocidade do chat: lote cheio encurta, lote vazio alonga, 429 dobra (e reseta pra cima do hint).
+    Jitter de ±YT_POLL_JITTER evita sincronizar com outros clientes.
+    """
+
+    def __init__(self):
+        self.factor = 1.0        # multiplicador sobre o hint do YouTube
+        self.hint = 5.0          # último timeoutMs (s)
+        self.interval = 5.0      # último intervalo escolhido (s), já com jitter
+        self.batch = 0           # ações no último poll
+        self.delay: float | None = None  # atraso ponta a ponta do último lote (s)
+        self.rate_backoff = 0.0  # espera atual de 429 (s)
+        self.polls = 0
+        self.rate_limits = 0
+
+    def on_poll(self, timeout_ms: int, batch: int, delay: float | None = None):
+        self.polls += 1
+        self.hint = max(timeout_ms / 1000, 0.1)
+        self.batch = batch
+        if delay is not None:
+            self.delay = delay
+        self.rate_backoff = 0.0
+        if batch >= YT_FULL_BATCH:
+            self.factor *= 0.7    # chat rápido — busca antes do hint pra não acumular atraso
+        elif batch == 0:
+            self.factor *= 1.25   # chat parado — espaça
+        else:
+            self.factor += (1.0 - self.factor) * 0.5  # volta pro hint
+        self.factor = min(max(self.factor, YT_POLL_MIN_FACTOR), YT_POLL_MAX_FACTOR)
+
+    def on_rate_limit(self) -> float:
+        """429: backoff exponencial e, depois dele, nunca mais rápido que o hint."""
+        self.rate_limits += 1
+        self.rate_backoff = min((self.rate_backoff or 10) * 2, 120)
+        self.factor = max(self.factor, 1.0)
+        self.interval = self.rate_backoff
+        return self.rate_backoff
+
+    def next_delay(self) -> float:
+        base = min(max(self.hint * self.factor, YT_POLL_MIN), YT_POLL_MAX)
+        self.interval = base * random.uniform(1 - YT_POLL_JITTER, 1 + YT_POLL_JITTER)
+        if self.polls % 30 == 0:
+            delay = f'{self.delay:.1f}s' if self.delay is not None else '-'
+            log('yt', 'INFO', f'poll: intervalo={self.interval:.1f}s hint={self.hint:.1f}s '
+                              f'lote={self.batch} atraso={delay}')
+        return self.interval
+
+
+_yt_schedulers: dict[str, YtPollScheduler] = {}  # video_id → scheduler (lido pelas métricas)
+
+
 def _yt_extract_token(html: str) -> str:
     patterns = [
         r'"reloadContinuationData"\s*:\s*\{\s*"continuation"\s*:\s*"([^"]{20,})"',
@@ -535,7 +1987,11 @@ def _yt_extract_token(html: str) -> str:
     return ''
 
 
-async def _yt_handle_action(action: dict):
+def _yt_handle_action(action: dict, ch: str = '', trace: tuple | None = None) -> float | None:
+    """
+    Publica a ação do chat. Retorna o timestampUsec do item (pra medir o atraso ponta a ponta).
+    trace = (resposta do poll recebida, JSON parseado), para a latência por estágio.
+    """
     item = (action.get('addChatItemAction') or {}).get('item') or {}
     msg = item.get('liveChatTextMessageRenderer')
     paid = item.get('liveChatPaidMessageRenderer')
@@ -545,30 +2001,222 @@ async def _yt_handle_action(action: dict):
         user = (msg.get('authorName') or {}).get('simpleText') or 'Anônimo'
         html = yt_parse_runs(msg.get('message', {}).get('runs') or [])
         if html.strip():
-            chat_msg = {'p': 'yt', 'user': user, 'color': '', 'html': html}
+            stamped = traced(trace)
+            chat_msg = {'p': 'yt', 'ch': ch, 'user': user, 'color': '', 'html': html}
             log('yt', 'CHAT', f'{user}: {html[:80]}')
-            broadcast(chat_msg)
-            await save_message(chat_msg)
+            save_message(broadcast(chat_msg, stamped))
 
     if paid:
         user = (paid.get('authorName') or {}).get('simpleText') or 'Anônimo'
         amount = (paid.get('purchaseAmountText') or {}).get('simpleText') or ''
-        broadcast({'p': 'sys', 'text': f'🔴 Super Chat de {esc(user)}: {esc(amount)}'})
+        broadcast({'p': 'sys', 'platform': 'yt', 'ch': ch, 'prio': PRIO_EVENT, 'text': f'🔴 Super Chat de {esc(user)}: {esc(amount)}'})
         html = yt_parse_runs(paid.get('message', {}).get('runs') or [])
         if html.strip():
-            chat_msg = {'p': 'yt', 'user': user, 'color': '#ffcc44', 'html': html}
-            broadcast(chat_msg)
-            await save_message(chat_msg)
+            chat_msg = {'p': 'yt', 'ch': ch, 'user': user, 'color': '#ffcc44', 'html': html, 'prio': PRIO_EVENT}
+            save_message(broadcast(chat_msg, traced(trace)))
 
     if mem:
         user = (mem.get('authorName') or {}).get('simpleText') or 'Alguém'
-        broadcast({'p': 'sys', 'text': f'🔴 {esc(user)} se tornou membro!'})
+        broadcast({'p': 'sys', 'platform': 'yt', 'ch': ch, 'prio': PRIO_EVENT, 'text': f'🔴 {esc(user)} se tornou membro!'})
+
+    renderer = msg or paid or mem
+    try:
+        return float(renderer['timestampUsec']) if renderer else None
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# ── Replay / simulação ────────────────────────────────────────────────────────
+# `python server.py --replay [arquivo|diretório]`: no lugar dos loops de plataforma, re-transmite um histórico
+# (segmentos do history/, um .jsonl ou um history.db) ou uma captura IRC crua da Twitch, lendo linha a linha do disco.
+# Linhas JSON usam o campo 'ts'; linhas IRC passam pelo parser/render de verdade e usam a tag tmi-sent-ts.
+
+def _replay_files(path: Path) -> list[Path]:
+    """Arquivos da fonte em ordem: um arquivo, ou os segmentos de um diretório de histórico (pelo manifest)."""
+    if not path.is_dir():
+        return [path]
+    try:
+        with open(path / 'manifest.json', encoding='utf-8') as f:
+            return [path / f'seg-{n:06d}.jsonl' for n, _ in json.load(f).get('segments') or []]
+    except (OSError, ValueError):
+        return sorted(path.glob('*.jsonl'))
+
+
+def _replay_lines(path: Path):
+    if path.suffix in ('.db', '.sqlite'):
+        yield from SqliteStore(path).lines()
+        return
+    for fpath in _replay_files(path):
+        try:
+            f = open(fpath, encoding='utf-8')
+        except FileNotFoundError:
+            continue
+        with f:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if line:
+                    yield line
+
+
+async def _replay_batches(path: Path):
+    """Linhas da fonte em lotes de REPLAY_READ_BATCH, cada lote lido numa thread."""
+    lines = _replay_lines(path)
+    while batch := await asyncio.to_thread(list, itertools.islice(lines, REPLAY_READ_BATCH)):
+        yield batch
+
+
+def _replay_entry(line: str):
+    """Linha da fonte → (ts em ms ou None, plataforma do chat ou None, função que publica). None = ignorar."""
+    if line.startswith('{'):
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(msg, dict) or msg.get('p') in ('reload', 'status', None):
+            return None
+        ts = msg.pop('ts', None)
+        msg.pop('id', None)  # id novo no broadcast — o antigo já foi visto pelos clientes
+        if msg['p'] in platform_status:
+            return ts, msg['p'], lambda: save_message(broadcast(msg))
+        return ts, None, lambda: broadcast(msg)
+    irc = parse_irc(line)
+    if irc.command not in ('PRIVMSG', 'USERNOTICE'):
+        return None
+    try:
+        ts = int(irc.tags.get('tmi-sent-ts') or 0) or None
+    except ValueError:
+        ts = None
+    return ts, 'tw', lambda: _tw_handle(irc)
+
+
+async def replay_loop(path: Path, speed: float = 1.0, repeat: bool = False):
+    """
+    Re-transmite a fonte no ritmo original (speed=1), N× mais rápido, ou sem esperar (speed=0).
+    Silêncios maiores que REPLAY_MAX_GAP são comprimidos; linhas sem timestamp saem a cada REPLAY_GAP.
+    """
+    loop = asyncio.get_running_loop()
+    rate = 'sem espera' if speed <= 0 else f'{speed:g}x'
+    passes = 0
+    while True:
+        passes += 1
+        log('replay', 'INFO', f'reproduzindo {path} ({rate}, passada #{passes})')
+        count = 0
+        due = loop.time()
+        prev_ts = None
+        async for batch in _replay_batches(path):
+            for line in batch:
+                entry = _replay_entry(line)
+                if entry is None:
+                    continue
+                ts, platform, publish = entry
+                if speed > 0 and count:
+                    gap = REPLAY_GAP if ts is None or prev_ts is None else (ts - prev_ts) / 1000
+                    due += min(max(gap, 0), REPLAY_MAX_GAP) / speed
+                    wait = due - loop.time()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                elif count % 50 == 0:
+                    await asyncio.sleep(0)  # deixa os clientes SSE escreverem entre os lotes
+                if platform and not platform_status[platform]:
+                    set_status(platform, True)  # bolinha de status acesa como se a plataforma estivesse conectada
+                publish()
+                prev_ts = ts if ts is not None else prev_ts
+                count += 1
+        log('replay', 'INFO', f'{count} mensagens reproduzidas')
+        if not repeat or not count:
+            return
 
 
 # ── File watcher (hot-reload) ─────────────────────────────────────────────────
 
+# inotify(7) — só as flags usadas aqui
+IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x8, 0x40, 0x80, 0x100, 0x200
+_INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len (+ nome com len bytes)
+
+
+def pages_changed(names: set[str]):
+    """Descarta o cache estático e recarrega só os clientes abertos a partir dessas páginas."""
+    for name in sorted(names):
+        log('watch', 'INFO', f'{name} modificado — recarregando clientes dessa página')
+        invalidate_static((DIR / name).resolve())
+        broadcast({'p': 'reload', 'page': name})
+
+
+def _inotify_open(path: Path) -> int | None:
+    """fd de inotify observando path (Linux). None se indisponível — aí o watcher cai no polling."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(fd, os.fsencode(path), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+def _inotify_names(data: bytes) -> set[str]:
+    names, off = set(), 0
+    while off + _INOTIFY_EVENT.size <= len(data):
+        _wd, _mask, _cookie, length = _INOTIFY_EVENT.unpack_from(data, off)
+        off += _INOTIFY_EVENT.size
+        name = data[off:off + length].rstrip(b'\0').decode(errors='replace')
+        off += length
+        if name.endswith('.html'):
+            names.add(name)
+    return names
+
+
 async def file_watcher_loop():
-    """Detecta mudanças nos .html e manda reload SSE para todos os clientes."""
+    """Detecta mudanças nos .html (inotify no Linux, polling de 1s fora dele) e manda reload SSE."""
+    fd = _inotify_open(DIR)
+    if fd is None:
+        log('watch', 'INFO', 'inotify indisponível — usando polling a cada 1s')
+        await _poll_watch_loop()
+        return
+
+    loop = asyncio.get_running_loop()
+    pending: set[str] = set()
+    timer: asyncio.TimerHandle | None = None
+
+    def flush():
+        nonlocal timer
+        timer = None
+        names = set(pending)
+        pending.clear()
+        pages_changed(names)
+
+    def on_readable():
+        nonlocal timer
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        names = _inotify_names(data)
+        if names:
+            pending.update(names)
+            # Debounce: editor costuma gerar vários eventos por save (tmp, rename, chmod)
+            if timer is not None:
+                timer.cancel()
+            timer = loop.call_later(WATCH_DEBOUNCE, flush)
+
+    loop.add_reader(fd, on_readable)
+    try:
+        await asyncio.Event().wait()  # roda até ser cancelada no shutdown
+    finally:
+        loop.remove_reader(fd)
+        if timer is not None:
+            timer.cancel()
+        os.close(fd)
+
+
+async def _poll_watch_loop():
     mtimes: dict[Path, float] = {}
     for f in DIR.glob('*.html'):
         try:
@@ -578,22 +2226,35 @@ async def file_watcher_loop():
 
     while True:
         await asyncio.sleep(1)
+        changed = set()
         for f in DIR.glob('*.html'):
             try:
                 mtime = f.stat().st_mtime
                 if f in mtimes and mtimes[f] != mtime:
-                    log('watch', 'INFO', f'{f.name} modificado — recarregando clientes')
-                    broadcast({'p': 'reload'})
+                    changed.add(f.name)
                 mtimes[f] = mtime
             except OSError:
                 pass
-
+        for f in [f for f in mtimes if not f.exists()]:
+            del mtimes[f]
+            changed.add(f.name)
+        if changed:
+            pages_changed(changed)
 
 
 # ── SSE endpoint ──────────────────────────────────────────────────────────────
 
 async def events_handler(request: web.Request) -> web.StreamResponse:
+    global dropped_total
     want_history = request.rel_url.query.get('history') == '1'
+    try:
+        last_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_id = None
+    try:
+        min_priority = int(request.rel_url.query.get('min_priority') or 0)
+    except ValueError:
+        raise web.HTTPBadRequest(text='min_priority deve ser um número inteiro')
     resp = web.StreamResponse(headers={
         'Content-Type': 'text/event-stream',
         'Cache-Control': 'no-cache',
@@ -603,21 +2264,6 @@ async def events_handler(request: web.Request) -> web.StreamResponse:
     })
     await resp.prepare(request)
 
-    # Stream last HISTORY_REPLAY lines of history
-    if want_history:
-        def read_lines():
-            if HISTORY_FILE.exists():
-                with open(HISTORY_FILE, encoding='utf-8') as f:
-                    return [l.strip() for l in f if l.strip()][-HISTORY_REPLAY:]
-            return []
-        for line in await asyncio.to_thread(read_lines):
-            await resp.write(f'data: {line}\n\n'.encode())
-
-    # Send current platform status
-    for p, on in platform_status.items():
-        status_msg = json.dumps({'p': 'status', 'platform': p, 'on': on})
-        await resp.write(f'data: {status_msg}\n\n'.encode())
-
     # Subscribe to live broadcasts
     ua_raw = request.headers.get('User-Agent', '')
     if 'OBS' in ua_raw:
@@ -631,43 +2277,680 @@ async def events_handler(request: web.Request) -> web.StreamResponse:
     else:
         client_id = 'desconhecido'
 
-    q: asyncio.Queue = asyncio.Queue(maxsize=200)
-    clients.add(q)
-    log('sse', 'INFO', f'conectado — {client_id} | history={want_history} | total={len(clients)}')
+    query = request.rel_url.query
+    client = SSEClient(client_id, request.transport,
+                       page=_client_page(request),
+                       platforms=_query_set(query, 'platforms'),
+                       kinds=_query_set(query, 'kinds'),
+                       min_priority=min_priority,
+                       debug=query.get('debug') == '1')
+
+    # Reconexão com Last-Event-ID: só o que faltou. Sem id (ou gap antigo demais), history=1 recebe o
+    # cache inteiro e /events puro não recebe nada (cache em memória, sem I/O)
+    replay = replay_frames(last_id, fallback=want_history, wants=client.wants)
+    # Send current platform status
+    status = [Envelope({'p': 'status', 'platform': p, 'on': on}) for p, on in platform_status.items()]
+    replay += b''.join(env.frame for env in status if client.wants(env))
+    # Inscreve no mesmo passo síncrono do snapshot — nada se perde nem duplica durante o write do replay
+    clients.add(client)
+    # retry: curto — num restart do hub o browser volta em SSE_RETRY_MS em vez do padrão dele (~3-5s)
+    await resp.write(f'retry: {SSE_RETRY_MS}\n\n'.encode() + replay)
+    mark_startup('first_sse_byte')
+
+    log('sse', 'INFO', f'conectado — {client_id} | history={want_history} | last_id={last_id} '
+                       f'| página={client.page} | filtro={client.describe()} | total={len(clients)}')
     try:
-        while True:
-            try:
-                data = await asyncio.wait_for(q.get(), timeout=20)
-            except asyncio.TimeoutError:
+        while not client.closed:
+            if not await client.wait(timeout=20):
                 # Keepalive ping — detecta desconexão mesmo sem mensagens chegando
                 await resp.write(b': keepalive\n\n')
                 continue
-            if data is None:  # sentinel de shutdown
-                break
-            await resp.write(data.encode())
-    except (ConnectionResetError, asyncio.CancelledError, Exception):
+            # Junta tudo que já está pendente num único write; mensagem isolada sai na hora
+            chunks: list[bytes] = []
+            sent: list[Envelope] = []
+            size = client.drain(chunks, 0, sent)
+            if SSE_FLUSH_MS and len(chunks) > 1 and not client.closed and size < SSE_BATCH_BYTES:
+                # Rajada em andamento — janela curta pra pegar o resto dela
+                await asyncio.sleep(SSE_FLUSH_MS / 1000)
+                size = client.drain(chunks, size, sent)
+            if chunks:
+                await resp.write(b''.join(chunks))
+            if sent:
+                done = time.perf_counter()
+                for env in sent:
+                    latency['write'].observe(done - env.trace[3])
+                    latency['total'].observe(done - env.trace[0])
+    except (ConnectionResetError, asyncio.CancelledError):
         pass
+    except Exception:
+        client.reason = client.reason or 'error'
     finally:
-        clients.discard(q)
-        log('sse', 'INFO', f'desconectado — {client_id} | total={len(clients)}')
+        clients.discard(client)
+        reason = client.reason or 'peer'
+        disconnects_total[reason] = disconnects_total.get(reason, 0) + 1
+        dropped_total += client.dropped
+        log('sse', 'INFO', f'desconectado — {client_id} | motivo={reason} | descartadas={client.dropped} '
+                           f'| maior atraso={client.max_lag} | total={len(clients)}')
     return resp
 
 
+def _client_page(request: web.Request) -> str | None:
+    """Página que abriu o EventSource: ?page= ou o Referer. None = desconhecida (recebe todo reload)."""
+    page = request.rel_url.query.get('page')
+    if page is None:
+        referer = request.headers.get('Referer')
+        if not referer:
+            return None
+        page = urlsplit(referer).path.rsplit('/', 1)[-1]
+    return page or DEFAULT_PAGE
+
+
+def _query_set(query, name: str) -> frozenset | None:
+    """?name=a,b,c → frozenset({'a', 'b', 'c'}); ausente ou vazio → None (sem filtro)."""
+    values = frozenset(v.strip() for v in query.get(name, '').split(',') if v.strip())
+    return values or None
+
+
+class SSEClient:
+    """
+    Buffer de um cliente SSE. Consumidor lento não derruba a conexão: os frames mais antigos saem
+    do ring buffer (e viram um aviso "N mensagens puladas" na política 'collapse').
+    """
+    __slots__ = ('name', 'transport', 'page', 'platforms', 'kinds', 'min_priority', 'debug',
+                 'pending', 'wakeup', 'closed', 'reason', 'skipped', 'dropped', 'max_lag', 'full_since')
+
+    def __init__(self, name: str, transport=None, page: str | None = None, platforms: frozenset | None = None,
+                 kinds: frozenset | None = None, min_priority: int = 0, debug: bool = False):
+        self.name = name
+        self.transport = transport
+        self.page = page                # reload só chega se for desta página
+        self.platforms = platforms      # None = todas
+        self.kinds = kinds              # None = todos ('chat', 'sys', 'status')
+        self.min_priority = min_priority
+        self.debug = debug              # frames de chat levam 'dbg' com a latência de cada estágio
+        self.pending: deque[Envelope] = deque()
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.reason: str | None = None  # quem encerrou: 'stalled', 'shutdown' (None = o próprio cliente)
+        self.skipped = 0     # descartadas desde o último write (vira o aviso do collapse)
+        self.dropped = 0     # descartadas na conexão toda
+        self.max_lag = 0     # maior número de frames pendentes visto num write
+        self.full_since: float | None = None
+
+    def wants(self, env: Envelope) -> bool:
+        """Filtro de inscrição — roda antes de enfileirar, então frames ignorados nem chegam a ser codificados."""
+        if env.kind == 'reload':
+            page = env.msg.get('page')
+            return page is None or self.page is None or page == self.page
+        if self.kinds is not None and env.kind not in self.kinds:
+            return False
+        if self.platforms is not None and env.platform is not None and env.platform not in self.platforms:
+            return False
+        return env.priority >= self.min_priority
+
+    def describe(self) -> str:
+        if self.platforms is None and self.kinds is None and not self.min_priority:
+            return 'tudo'
+        return (f'{",".join(sorted(self.platforms or platform_status))}/'
+                f'{",".join(sorted(self.kinds or ("chat", "status", "sys")))}/prio>={self.min_priority}')
+
+    def push(self, env: Envelope) -> bool:
+        """Enfileira o frame. Retorna False quando o cliente está travado há mais de SSE_STALL_TIMEOUT."""
+        if len(self.pending) >= SSE_CLIENT_BUFFER:
+            self.pending.popleft()
+            self.skipped += 1
+            self.dropped += 1
+            now = time.monotonic()
+            if self.full_since is None:
+                self.full_since = now
+            elif now - self.full_since > SSE_STALL_TIMEOUT:
+                return False
+        self.pending.append(env)
+        self.wakeup.set()
+        return True
+
+    async def wait(self, timeout: float) -> bool:
+        """Espera ter algo pendente (ou o fechamento). False = timeout."""
+        if self.pending or self.closed:
+            return True
+        self.wakeup.clear()
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def drain(self, chunks: list[bytes], size: int, traced: list['Envelope'] | None = None) -> int:
+        """
+        Move frames pendentes para chunks até SSE_BATCH_BYTES. Retorna os bytes acumulados.
+        Mensagens com trace vão também para traced — o handler fecha o estágio write depois do write.
+        """
+        self.max_lag = max(self.max_lag, len(self.pending))
+        if self.skipped:
+            if SSE_LAG_POLICY == 'collapse':
+                marker = Envelope({'p': 'sys', 'text': f'⏩ {self.skipped} mensagens puladas (conexão lenta)'})
+                # O aviso é um frame sys como outro qualquer: passa pelo filtro (overlay com kinds=chat não recebe)
+                if self.wants(marker):
+                    chunks.append(marker.frame)
+                    size += len(marker.frame)
+            self.skipped = 0
+        while size < SSE_BATCH_BYTES and self.pending:
+            env = self.pending.popleft()
+            if env.trace is not None and traced is not None:
+                traced.append(env)
+                frame = env.debug_frame if self.debug else env.frame
+            else:
+                frame = env.frame
+            chunks.append(frame)
+            size += len(frame)
+        self.full_since = None
+        return size
+
+    def close(self, abort: bool = False, reason: str = 'shutdown'):
+        """Encerra o handler. abort derruba o socket — destrava um write que nunca termina."""
+        self.closed = True
+        self.reason = self.reason or reason
+        self.wakeup.set()
+        if abort and self.transport is not None:
+            self.transport.abort()
+
+
 # ── Static file handler ───────────────────────────────────────────────────────
 
+class StaticAsset(NamedTuple):
+    fpath: Path
+    mime: str
+    charset: str | None
+    body: bytes
+    gzip: bytes | None
+    br: bytes | None
+    etag: str               # hash do conteúdo; cada codificação ganha um sufixo próprio
+    stat: tuple[int, int]   # (mtime_ns, tamanho) quando foi lido
+    watched: bool           # .html da raiz: invalidado pelo file watcher; o resto revalida por stat
+
+
+_static_cache: OrderedDict[Path, StaticAsset] = OrderedDict()  # arquivo (resolvido) → asset pronto pra servir
+_COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+
+def _load_static(fpath: Path) -> StaticAsset | None:
+    """Lê o arquivo e pré-calcula ETag e variantes comprimidas (roda em thread)."""
+    try:
+        st = fpath.stat()
+        body = fpath.read_bytes()
+    except OSError:
+        return None
+    mime, _ = mimetypes.guess_type(str(fpath))
+    if fpath.suffix == '.html':
+        mime = 'text/html'
+    mime = mime or 'application/octet-stream'
+    gz = br = None
+    if mime.startswith(_COMPRESSIBLE) and len(body) > 256:
+        gz = gzip.compress(body, 9, mtime=0)
+        if brotli is not None:
+            br = brotli.compress(body)
+    return StaticAsset(
+        fpath=fpath,
+        mime=mime,
+        charset='utf-8' if mime.startswith('text/') else None,
+        body=body,
+        gzip=gz,
+        br=br,
+        etag=hashlib.sha256(body).hexdigest()[:32],
+        stat=(st.st_mtime_ns, st.st_size),
+        watched=fpath.suffix == '.html' and fpath.parent == DIR,  # o watcher só olha DIR/*.html
+    )
+
+
+def _static_changed(asset: StaticAsset) -> bool:
+    try:
+        st = asset.fpath.stat()
+    except OSError:
+        return True
+    return (st.st_mtime_ns, st.st_size) != asset.stat
+
+
+def invalidate_static(fpath: Path):
+    """Chamado pelo file watcher quando um arquivo muda (ou some)."""
+    _static_cache.pop(fpath, None)
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    encodings = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q=') and q[2:].strip() in ('0', '0.0', '0.00', '0.000'):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
 async def static_handler(request: web.Request) -> web.Response:
-    path = request.match_info.get('path', '') or 'xumbrega_multichat.html'
+    path = request.match_info.get('path', '') or DEFAULT_PAGE
+    # Chave = arquivo resolvido: '/a.html', '/./a.html' e '/sub/../a.html' dividem a mesma entrada
     fpath = (DIR / path).resolve()
     if not fpath.is_relative_to(DIR):
         raise web.HTTPForbidden()
-    if not fpath.is_file():
+    asset = _static_cache.get(fpath)
+    if asset is not None and not asset.watched and await asyncio.to_thread(_static_changed, asset):
+        asset = None
+    if asset is None:
+        if not fpath.is_file():
+            raise web.HTTPNotFound()
+        asset = await asyncio.to_thread(_load_static, fpath)
+        if asset is None:
+            raise web.HTTPNotFound()
+        _static_cache[fpath] = asset
+        if len(_static_cache) > STATIC_CACHE_SIZE:
+            _static_cache.popitem(last=False)
+    else:
+        _static_cache.move_to_end(fpath)
+
+    accepted = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    if asset.br is not None and 'br' in accepted:
+        body, encoding = asset.br, 'br'
+    elif asset.gzip is not None and 'gzip' in accepted:
+        body, encoding = asset.gzip, 'gzip'
+    else:
+        body, encoding = asset.body, None
+    etag = f'"{asset.etag}-{encoding}"' if encoding else f'"{asset.etag}"'
+    headers = {
+        'ETag': etag,
+        'Cache-Control': 'no-cache',  # sempre revalida — hot-reload troca o conteúdo
+        'Vary': 'Accept-Encoding',
+    }
+    inm = request.headers.get('If-None-Match', '')
+    if inm and (inm.strip() == '*' or f'"{asset.etag}' in inm):
+        return web.Response(status=304, headers=headers)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return web.Response(body=body, content_type=asset.mime, charset=asset.charset, headers=headers)
+
+
+# ── Emote proxy ───────────────────────────────────────────────────────────────
+# /emote/{platform}/{id} serve as imagens a partir de um cache em disco endereçado por conteúdo
+# (emote_cache/objects/<sha256>) com um conjunto quente em memória. Cada OBS/reload pega do cache
+# local em vez de bater na CDN de novo.
+
+EMOTE_UPSTREAM = {
+    'tw': 'https://static-cdn.jtvnw.net/emoticons/v2/{id}/default/dark/1.0',
+    'ki': 'https://files.kick.com/emotes/{id}/fullsize',
+}
+EMOTE_FETCH_TIMEOUT = ClientTimeout(total=15)
+_EMOTE_ID = re.compile(r'[A-Za-z0-9_-]{1,80}')
+_emote_index: dict[str, dict] = {}   # 'tw/25' → {'sha': ..., 'type': ..., ['url': ...]}
+_emote_hot: OrderedDict[str, tuple[bytes, str, str]] = OrderedDict()  # chave → (corpo, sha, content-type)
+_emote_inflight: dict[str, asyncio.Future] = {}
+_emote_dirty = False                         # _emote_index tem entradas que ainda não foram pro disco
+_emote_flush: asyncio.Task | None = None
+_emote_tmp_ids = itertools.count()
+_yt_emoji_urls: dict[str, str] = {}  # id curto → URL original (YouTube não tem id estável de emoji)
+
+
+def emote_url(platform: str, ref: str) -> str:
+    """URL do <img> de um emote: proxy local se EMOTE_PROXY, senão a CDN. ref é o id (tw/ki) ou a URL (yt)."""
+    if platform == 'yt':
+        if not EMOTE_PROXY:
+            return ref
+        id_ = hashlib.sha1(ref.encode()).hexdigest()[:20]
+        if _yt_emoji_urls.setdefault(id_, ref) is ref and _workers:
+            _feed_workers(f'e\t{id_}\t{ref}\n'.encode())  # worker precisa do id antes do frame que o cita
+        return f'/emote/yt/{id_}'
+    if EMOTE_PROXY:
+        return f'/emote/{platform}/{ref}'
+    return EMOTE_UPSTREAM[platform].format(id=ref)
+
+
+async def emote_fetcher(url: str) -> tuple[bytes, str] | None:
+    """Busca a imagem na CDN. Retorna (corpo, content-type) ou None se não existe. Substituível em testes."""
+    async with http_session().get(url, timeout=EMOTE_FETCH_TIMEOUT) as r:
+        if r.status == 404:
+            return None
+        r.raise_for_status()
+        return await r.read(), r.headers.get('Content-Type', 'image/png').split(';')[0]
+
+
+def load_emote_index():
+    global _emote_index
+    try:
+        with open(EMOTE_CACHE_DIR / 'index.json', encoding='utf-8') as f:
+            _emote_index = json.load(f)
+    except (OSError, ValueError):
+        _emote_index = {}
+    for key, entry in _emote_index.items():
+        if key.startswith('yt/') and entry.get('url'):
+            _yt_emoji_urls[key[3:]] = entry['url']
+
+
+def _emote_tmp(path: Path) -> Path:
+    """Temporário exclusivo deste processo/escrita — workers gravam no mesmo emote_cache/ ao mesmo tempo."""
+    return path.with_name(f'{path.name}.{os.getpid()}.{next(_emote_tmp_ids)}.tmp')
+
+
+def _store_emote(body: bytes, sha: str):
+    """Grava o objeto (se ainda não existe) via arquivo temporário + rename. O índice vai depois, em lote."""
+    objects = EMOTE_CACHE_DIR / 'objects'
+    objects.mkdir(parents=True, exist_ok=True)
+    obj = objects / sha
+    if not obj.exists():
+        tmp = _emote_tmp(obj)
+        tmp.write_bytes(body)
+        os.replace(tmp, obj)
+
+
+def _write_emote_index(index: dict[str, dict]) -> dict[str, dict]:
+    """Junta com o index.json do disco (entradas de outros workers) e regrava. Retorna o índice mesclado."""
+    path = EMOTE_CACHE_DIR / 'index.json'
+    EMOTE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(EMOTE_CACHE_DIR / 'index.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # ler-mesclar-gravar atômico entre processos; solta no close
+        try:
+            with open(path, encoding='utf-8') as f:
+                merged = {**json.load(f), **index}
+        except (OSError, ValueError):
+            merged = index
+        tmp = _emote_tmp(path)
+        tmp.write_text(json.dumps(merged), encoding='utf-8')
+        os.replace(tmp, path)
+    return merged
+
+
+def index_emote(key: str, sha: str, ctype: str, url: str | None):
+    """Registra o emote no índice em memória e agenda a gravação do index.json (uma a cada EMOTE_INDEX_FLUSH)."""
+    global _emote_dirty, _emote_flush
+    _emote_index[key] = {'sha': sha, 'type': ctype, **({'url': url} if url else {})}
+    _emote_dirty = True
+    if _emote_flush is None:
+        _emote_flush = asyncio.create_task(_flush_emote_index())
+
+
+async def _flush_emote_index():
+    global _emote_dirty, _emote_flush
+    try:
+        while _emote_dirty:
+            await asyncio.sleep(EMOTE_INDEX_FLUSH)
+            _emote_dirty = False
+            merged = await asyncio.to_thread(_write_emote_index, dict(_emote_index))
+            for key, entry in merged.items():
+                _emote_index.setdefault(key, entry)
+    except OSError as e:
+        log('emote', 'WARN', f'erro ao gravar o índice do cache: {e}')
+    finally:
+        _emote_flush = None
+
+
+async def save_emote_index():
+    """Shutdown: grava na hora o que estava esperando o próximo flush."""
+    if _emote_flush is not None:
+        _emote_flush.cancel()
+        await asyncio.gather(_emote_flush, return_exceptions=True)
+    if _emote_dirty:
+        try:
+            await asyncio.to_thread(_write_emote_index, dict(_emote_index))
+        except OSError as e:
+            log('emote', 'WARN', f'erro ao gravar o índice do cache: {e}')
+
+
+def _read_emote(key: str) -> tuple[bytes, str, str] | None:
+    entry = _emote_index.get(key)
+    if not entry:
+        return None
+    try:
+        body = (EMOTE_CACHE_DIR / 'objects' / entry['sha']).read_bytes()
+    except OSError:
+        return None
+    return body, entry['sha'], entry['type']
+
+
+async def get_emote(platform: str, id_: str) -> tuple[bytes, str, str] | None:
+    """(corpo, sha256, content-type): memória → disco → CDN. Pedidos simultâneos do mesmo emote viram uma busca só."""
+    key = f'{platform}/{id_}'
+    item = _emote_hot.get(key)
+    if item:
+        _emote_hot.move_to_end(key)
+        return item
+    if key in _emote_inflight:
+        return await asyncio.shield(_emote_inflight[key])
+    fut = asyncio.get_running_loop().create_future()
+    _emote_inflight[key] = fut
+    try:
+        item = await asyncio.to_thread(_read_emote, key)
+        if item is None:
+            url = _yt_emoji_urls.get(id_) if platform == 'yt' else EMOTE_UPSTREAM[platform].format(id=id_)
+            fetched = await emote_fetcher(url) if url else None
+            if fetched:
+                body, ctype = fetched
+                sha = hashlib.sha256(body).hexdigest()
+                await asyncio.to_thread(_store_emote, body, sha)
+                index_emote(key, sha, ctype, url if platform == 'yt' else None)
+                item = (body, sha, ctype)
+        if item:
+            _emote_hot[key] = item
+            if len(_emote_hot) > EMOTE_HOT_SIZE:
+                _emote_hot.popitem(last=False)
+        fut.set_result(item)
+        return item
+    except BaseException as e:
+        fut.set_exception(e)
+        fut.exception()  # marca como lida — quem não esperava pela busca não gera warning
+        raise
+    finally:
+        del _emote_inflight[key]
+
+
+async def emote_handler(request: web.Request) -> web.Response:
+    platform = request.match_info['platform']
+    id_ = request.match_info['id']
+    if platform not in ('tw', 'ki', 'yt') or not _EMOTE_ID.fullmatch(id_):
         raise web.HTTPNotFound()
-    mime, _ = mimetypes.guess_type(str(fpath))
-    if fpath.suffix == '.html':
-        mime = 'text/html'
-    data = await asyncio.to_thread(fpath.read_bytes)
-    charset = 'utf-8' if (mime or '').startswith('text/') else None
-    return web.Response(body=data, content_type=mime or 'application/octet-stream', charset=charset)
+    try:
+        item = await get_emote(platform, id_)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        log('emote', 'WARN', f'{platform}/{id_}: falha na CDN ({type(e).__name__}: {e})')
+        raise web.HTTPBadGateway()
+    if item is None:
+        raise web.HTTPNotFound()
+    body, sha, ctype = item
+    headers = {
+        'ETag': f'"{sha}"',  # forte: o conteúdo de um id nunca muda
+        'Cache-Control': 'public, max-age=31536000, immutable',
+    }
+    if f'"{sha}"' in request.headers.get('If-None-Match', ''):
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=body, content_type=ctype, headers=headers)
+
+
+# ── Workers (multi-processo) ──────────────────────────────────────────────────
+# Com workers > 0, o processo principal só faz ingestão (plataformas, render, histórico, file watcher) e N
+# processos filhos servem /events e os estáticos na mesma porta (SO_REUSEPORT — o kernel distribui as
+# conexões). Cada frame broadcast vai uma vez, já serializado, por um Unix socket para cada worker, que faz o
+# fan-out para os clientes dele. Registros do canal, um por linha (campos separados por tab):
+#   b  <trace>       <json>   frame para broadcast (status atualiza platform_status; reload invalida o estático)
+#   r                <json>   mensagem do cache de replay (snapshot na conexão — não vai pros clientes)
+#   s  <plataforma>  <0|1>    estado da plataforma (snapshot)
+#   q  <seq>                  último id emitido (snapshot)
+#   e  <id>          <url>    emoji do YouTube registrado no proxy de emotes
+#   t  <seq>                  retenção: mensagens com id < seq saíram do disco (e saem do /history)
+# ids, ts e o cache de replay nascem todos no processo de ingestão; os workers só espelham.
+
+_workers: set[asyncio.StreamWriter] = set()
+_WORKER_PATHS = ('HISTORY_FILE', 'HISTORY_DIR', 'HISTORY_MANIFEST', 'HISTORY_DB', 'EMOTE_CACHE_DIR')  # repassados aos workers
+
+
+def workers_supported() -> bool:
+    return hasattr(socket, 'SO_REUSEPORT') and hasattr(socket, 'AF_UNIX')
+
+
+def _feed_path(port: int) -> Path:
+    import tempfile
+    return Path(tempfile.gettempdir()) / f'xumbrega-hub-{port}.sock'
+
+
+def _feed_workers(data: bytes):
+    for w in list(_workers):
+        if w.transport.get_write_buffer_size() > WORKER_BUFFER_BYTES:
+            # Worker parado — derruba o canal; ele reconecta e recebe um snapshot novo
+            log('workers', 'WARN', f'worker não acompanha ({WORKER_BUFFER_BYTES // 1024 // 1024} MB pendentes) — reconectando')
+            _workers.discard(w)
+            w.transport.abort()  # close() ainda esperaria o buffer esvaziar pra um peer que não lê
+        else:
+            w.write(data)
+
+
+def _feed_frame(env: Envelope):
+    trace = ','.join(repr(t) for t in env.trace) if env.trace else ''
+    _feed_workers(f'b\t{trace}\t{env.json}\n'.encode())
+
+
+async def _worker_connected(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Novo worker no canal: snapshot do estado compartilhado e, no mesmo passo síncrono, entra no fan-out."""
+    lines = [f'q\t{_seq}\t\n']
+    lines += [f's\t{p}\t{int(on)}\n' for p, on in platform_status.items()]
+    lines += [f'e\t{id_}\t{url}\n' for id_, url in _yt_emoji_urls.items()]
+    lines += [f'r\t\t{env.json}\n' for env in _replay_tail]
+    if _index_oldest:
+        lines.append(f't\t{_index_oldest}\t\n')
+    writer.write(''.join(lines).encode())
+    _workers.add(writer)
+    try:
+        await reader.read()  # worker não manda nada — só espera o EOF
+    finally:
+        _workers.discard(writer)
+        writer.close()
+
+
+async def worker_feed(reader: asyncio.StreamReader):
+    """Lado do worker: aplica os registros do canal até o processo de ingestão fechar."""
+    global _seq
+    while line := await reader.readline():
+        kind, a, rest = line.decode().rstrip('\n').split('\t', 2)
+        if kind == 'b':
+            env = Envelope(json_line=rest)
+            if a:
+                env.trace = tuple(float(t) for t in a.split(','))
+            _seq = max(_seq, env.seq or 0)
+            if env.kind == 'status':
+                platform_status[env.platform] = bool(env.msg.get('on'))
+            elif env.kind == 'reload' and env.msg.get('page'):
+                invalidate_static((DIR / env.msg['page']).resolve())
+            broadcast(env)
+            if env.kind == 'chat':
+                _replay_tail.append(env)
+                if HISTORY_PERSIST:
+                    index_message(env)
+        elif kind == 'r':
+            env = Envelope(json_line=rest)
+            _replay_tail.append(env)
+            index_message(env)
+        elif kind == 's':
+            platform_status[a] = rest == '1'
+        elif kind == 'q':
+            _seq = max(_seq, int(a))
+        elif kind == 'e':
+            _yt_emoji_urls[a] = rest
+        elif kind == 't':
+            trim_history_index(int(a))
+
+
+async def worker_main(cfg: dict, index: int):
+    """Processo worker: serve HTTP na porta compartilhada e espelha o canal do processo de ingestão."""
+    global LOG_TAG, _STARTED, HISTORY_PERSIST
+    LOG_TAG = f'w{index}:'
+    HISTORY_PERSIST = not cfg.get('replay')  # mesmo critério do processo principal (main)
+    _STARTED = cfg.get('started', _STARTED)  # tempos de start contam do processo principal
+    # spawn reimporta o módulo: caminhos trocados em runtime no processo principal (bench, testes) vêm pela cfg
+    globals().update((name, Path(path)) for name, path in cfg.get('paths', {}).items())
+    port = cfg['port']
+    load_emote_index()
+    open_http()
+    use_history_backend(cfg)
+    runner = web.AppRunner(make_app())
+    await runner.setup()
+    site = web.TCPSite(runner, cfg.get('host') or DEFAULT_HOST, port, reuse_port=True)
+    await site.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async def follow():
+        while not stop.is_set():
+            try:
+                reader, writer = await asyncio.open_unix_connection(str(_feed_path(port)), limit=WORKER_LINE_LIMIT)
+            except OSError:
+                break  # ingestão encerrou
+            _replay_tail.clear()
+            try:
+                await worker_feed(reader)
+            except (ValueError, ConnectionError) as e:
+                log('workers', 'WARN', f'canal interrompido: {type(e).__name__}: {e}')
+            finally:
+                writer.close()
+            await asyncio.sleep(0.2)
+        stop.set()
+
+    index_task = start_history_index() if history_index is None else None
+    feed_task = asyncio.create_task(follow())
+    log('workers', 'INFO', f'servindo na porta {port}')
+    await stop.wait()
+
+    await site.stop()
+    for client in list(clients):
+        client.close()
+    for _ in range(40):
+        if not clients:
+            break
+        await asyncio.sleep(0.05)
+    tasks = [t for t in (feed_task, index_task) if t]
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await save_emote_index()
+    await close_http()
+    await runner.cleanup()
+
+
+def _worker_process(cfg: dict, index: int):
+    asyncio.run(worker_main(cfg, index))
+
+
+async def start_workers(cfg: dict, count: int):
+    """Abre o canal e sobe os workers. Retorna (servidor do canal, processos)."""
+    path = _feed_path(cfg['port'])
+    path.unlink(missing_ok=True)
+    feed_server = await asyncio.start_unix_server(_worker_connected, str(path))
+    import multiprocessing  # workers são opcionais — o start padrão não paga esse import
+    ctx = multiprocessing.get_context('spawn')
+    cfg = {**cfg, 'paths': {name: str(globals()[name]) for name in _WORKER_PATHS}}
+    procs = [ctx.Process(target=_worker_process, args=(cfg, i + 1), daemon=True) for i in range(count)]
+    for p in procs:
+        p.start()
+    # Worker só conecta no canal depois de escutar a porta — quando todos entram, o hub está pronto
+    for _ in range(200):
+        if len(_workers) >= count or not any(p.is_alive() for p in procs):
+            break
+        await asyncio.sleep(0.05)
+    if len(_workers) < count:
+        log('workers', 'WARN', f'só {len(_workers)} de {count} workers prontos em 10s')
+    return feed_server, procs
+
+
+async def stop_workers(port: int, feed_server, procs):
+    """Fecha o canal (os workers desconectam seus clientes e saem) e espera os processos."""
+    feed_server.close()
+    _feed_path(port).unlink(missing_ok=True)  # sem o arquivo o worker não reconecta — encerra
+    for w in list(_workers):
+        w.close()
+    _workers.clear()
+    for p in procs:
+        await asyncio.to_thread(p.join, 5)
+        if p.is_alive():
+            p.terminate()
 
 
 # ── Single-instance lock ──────────────────────────────────────────────────────
@@ -779,6 +3062,8 @@ def ask_startup_config() -> dict | None:
         tk.Entry(yt_frame, textvariable=yt_id, width=22).pack(side='left')
 
         tk.Label(root, text='ex: youtube.com/watch?v=Fpfdw0iXuv8  (o código após "v=")',
+                 fg='gray', font=('TkDefaultFont', 8)).pack(padx=16, pady=(0, 2))
+        tk.Label(root, text='vários canais/vídeos por plataforma: separe por vírgula (co-stream)',
                  fg='gray', font=('TkDefaultFont', 8)).pack(padx=16, pady=(0, 8))
 
         # ── Porta ──
@@ -806,6 +3091,9 @@ def ask_startup_config() -> dict | None:
             if has_ki and not ki_id.get().strip():
                 messagebox.showerror('Erro', 'Kick marcado mas chatroom ID em branco.')
                 return
+            if has_ki and len(split_list(ki_ch.get())) != len(split_list(ki_id.get())):
+                messagebox.showerror('Erro', 'Kick: informe um chatroom ID para cada canal (mesma ordem).')
+                return
             if has_yt and not yt_id.get().strip():
                 messagebox.showerror('Erro', 'YouTube marcado mas video ID em branco.')
                 return
@@ -828,8 +3116,14 @@ def ask_startup_config() -> dict | None:
                 'ki_id':      ki_id.get().strip(),
                 'yt':         yt_id.get().strip() if has_yt else '',
                 'port':       port,
+                'history_sync': cfg.get('history_sync', HISTORY_SYNC),
+                'emote_proxy':  cfg.get('emote_proxy', EMOTE_PROXY),
+                'history_backend': cfg.get('history_backend', HISTORY_BACKEND),
+                'workers':      cfg.get('workers', SSE_WORKERS),
+                'host':         cfg.get('host', DEFAULT_HOST),
             }
             save_config({
+                **cfg,
                 'tw_on':          has_tw,
                 'tw_channel':     result[0]['tw_channel'],
                 'ki_on':          has_ki,
@@ -860,45 +3154,161 @@ def ask_startup_config() -> dict | None:
 
     except Exception as e:
         log('start', 'WARN', f'dialog indisponível ({e}) — usando config salva ou padrões')
-        cfg = load_config()
-        return {
-            'tw':         cfg.get('tw_on', True),
-            'tw_channel': cfg.get('tw_channel', 'xumbr3ga'),
-            'ki':         cfg.get('ki_on', True),
-            'ki_channel': cfg.get('ki_channel', 'xumbr3ga'),
-            'ki_id':      cfg.get('ki_chatroom_id', '45573790'),
-            'yt':         cfg.get('yt_video_id', '') if cfg.get('yt_on', False) else '',
-            'port':       cfg.get('port', 8080),
-        }
+        return saved_config()
+
+
+def saved_config() -> dict:
+    """Config de execução a partir do config.json (ou padrões), sem dialog."""
+    cfg = load_config()
+    return {
+        'tw':         cfg.get('tw_on', True),
+        'tw_channel': cfg.get('tw_channel', 'xumbr3ga'),
+        'ki':         cfg.get('ki_on', True),
+        'ki_channel': cfg.get('ki_channel', 'xumbr3ga'),
+        'ki_id':      cfg.get('ki_chatroom_id', '45573790'),
+        'yt':         cfg.get('yt_video_id', '') if cfg.get('yt_on', False) else '',
+        'port':       cfg.get('port', 8080),
+        'history_sync': cfg.get('history_sync', HISTORY_SYNC),
+        'emote_proxy':  cfg.get('emote_proxy', EMOTE_PROXY),
+        'history_backend': cfg.get('history_backend', HISTORY_BACKEND),
+        'workers':      cfg.get('workers', SSE_WORKERS),
+        'host':         cfg.get('host', DEFAULT_HOST),
+    }
+
+
+# ── Modo headless ─────────────────────────────────────────────────────────────
+# Sem tkinter: config vem do config.json + variáveis de ambiente + flags da CLI (nessa ordem de prioridade
+# crescente). Pensado pra servidor/container/systemd, onde o restart precisa ser rápido e sem interação.
+
+HEADLESS_ENV = {  # variável de ambiente → chave da config
+    'XUMBREGA_TW':    'tw_channel',
+    'XUMBREGA_KI':    'ki_channel',
+    'XUMBREGA_KI_ID': 'ki_id',
+    'XUMBREGA_YT':    'yt',
+    'XUMBREGA_PORT':  'port',
+    'XUMBREGA_HOST':  'host',
+}
+
+
+def is_headless(args) -> bool:
+    """--headless, qualquer flag de plataforma, XUMBREGA_HEADLESS=1 ou Linux sem display."""
+    if args.headless or os.environ.get('XUMBREGA_HEADLESS') == '1':
+        return True
+    if any(getattr(args, key) is not None for key in ('tw', 'ki', 'ki_id', 'yt')):
+        return True
+    return sys.platform.startswith('linux') and not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+
+def headless_config(args) -> dict:
+    """
+    Config sem dialog: config.json → XUMBREGA_* → flags. Canal não vazio liga a plataforma,
+    vazio desliga (ex.: --yt '' ou XUMBREGA_TW=). Nada é salvo no config.json.
+    ValueError com a mensagem pro usuário se porta ou canais da Kick não fecham (mesmas regras do dialog).
+    """
+    cfg = saved_config()
+    overrides = {key: os.environ[env] for env, key in HEADLESS_ENV.items() if env in os.environ}
+    overrides.update({key: value for key, value in (('tw_channel', args.tw), ('ki_channel', args.ki),
+                                                      ('ki_id', args.ki_id), ('yt', args.yt))
+                      if value is not None})
+    cfg.update(overrides)
+    if 'tw_channel' in overrides:
+        cfg['tw'] = bool(split_list(cfg['tw_channel']))
+    if 'ki_channel' in overrides:
+        cfg['ki'] = bool(split_list(cfg['ki_channel']))
+    elif 'ki_id' in overrides:
+        cfg['ki'] = bool(split_list(cfg['ki_id']))
+    if cfg['ki'] and len(split_list(cfg['ki_channel'])) != len(split_list(cfg['ki_id'])):
+        raise ValueError('Kick: informe um chatroom ID para cada canal, na mesma ordem (--ki / --ki-id)')
+    cfg['port'] = parse_port(cfg['port'])
+    return cfg
+
+
+def parse_port(value) -> int:
+    try:
+        port = int(str(value).strip())
+    except ValueError:
+        port = 0
+    if not 1 <= port <= 65535:
+        raise ValueError(f'porta inválida: {value!r} (use um número entre 1 e 65535)')
+    return port
 
 
 # ── Main ──────────────────────────────────────────────────────────────────────
 
-async def main(cfg: dict):
-    global _history_lock, TW_CH, KI_CH, KI_CHATROOM_ID, _msg_count
-    _history_lock = asyncio.Lock()
+def split_list(value: str) -> list[str]:
+    """'a, b,,c' → ['a', 'b', 'c'] — campos do dialog/config aceitam vários canais separados por vírgula."""
+    return [v.strip() for v in str(value or '').split(',') if v.strip()]
 
-    TW_CH          = cfg['tw_channel']
-    KI_CH          = cfg['ki_channel']
-    KI_CHATROOM_ID = cfg['ki_id']
-    video_id       = cfg['yt']
-    port           = cfg['port']
 
-    # Inicializa contador com número real de linhas existentes
-    if HISTORY_FILE.exists():
-        with open(HISTORY_FILE, encoding='utf-8') as f:
-            _msg_count = sum(1 for line in f if line.strip())
-    else:
-        _msg_count = 0
+def load_channels(cfg: dict):
+    """Preenche o registro CHANNELS a partir da config (só plataformas habilitadas)."""
+    CHANNELS['tw'] = {name.lstrip('#').lower(): name.lstrip('#') for name in split_list(cfg['tw_channel'])} if cfg['tw'] else {}
+    names, ids = split_list(cfg['ki_channel']), split_list(cfg['ki_id'])
+    # Canal sem nome correspondente usa o próprio chatroom ID como rótulo
+    CHANNELS['ki'] = {room: (names[i] if i < len(names) else room) for i, room in enumerate(ids)} if cfg['ki'] else {}
+    CHANNELS['yt'] = {vid: vid for vid in split_list(cfg['yt'])}
+
 
+def make_app() -> web.Application:
     app = web.Application()
     app.router.add_get('/events', events_handler)
+    app.router.add_get('/emote/{platform}/{id}', emote_handler)
+    app.router.add_get('/history', history_handler)
+    app.router.add_get('/metrics', metrics_handler)
+    app.router.add_post('/trace', trace_handler)
     app.router.add_get('/{path:.*}', static_handler)
+    return app
 
-    runner = web.AppRunner(app)
-    await runner.setup()
-    site = web.TCPSite(runner, 'localhost', port)
-    await site.start()
+
+def use_history_backend(cfg: dict):
+    """Escolhe o backend do histórico pela config (HISTORY_BACKEND se ausente ou desconhecido)."""
+    global _store, HISTORY_BACKEND, history_index
+    if cfg.get('history_backend') in ('segments', 'sqlite'):
+        HISTORY_BACKEND = cfg['history_backend']
+    _store = make_store(HISTORY_BACKEND)
+    if isinstance(_store, SqliteStore):
+        history_index = _store  # /history direto no banco — nada a montar em memória
+
+
+async def main(cfg: dict):
+    global _history_queue, HISTORY_SYNC, HISTORY_PERSIST, EMOTE_PROXY
+    _history_queue = asyncio.Queue()
+    HISTORY_PERSIST = not cfg.get('replay')
+
+    load_channels(cfg)
+    port           = cfg['port']
+    if cfg.get('history_sync') in ('none', 'flush', 'fsync'):
+        HISTORY_SYNC = cfg['history_sync']
+    if EMOTE_PROXY != cfg.get('emote_proxy', EMOTE_PROXY):
+        EMOTE_PROXY = bool(cfg['emote_proxy'])
+        for fn in (_tw_emote_img, _ki_emote_img, _yt_emoji_img, tw_render, ki_render):
+            fn.cache_clear()  # HTML já renderizado aponta pro destino antigo
+    load_emote_index()
+
+    # Inicializa contador e cache de replay a partir do histórico (migra messages.jsonl se preciso)
+    use_history_backend(cfg)
+    load_history()
+
+    # Session HTTP única para todas as plataformas e o proxy de emotes (pool + cache de DNS)
+    open_http()
+
+    workers = int(cfg.get('workers', SSE_WORKERS) or 0)
+    if workers and not workers_supported():
+        log('workers', 'WARN', 'SO_REUSEPORT/Unix socket indisponível neste sistema — servindo num processo só')
+        workers = 0
+
+    host = cfg.get('host') or DEFAULT_HOST
+    if workers:
+        # Este processo só ingere; quem escuta a porta são os workers
+        runner = site = None
+        cfg.setdefault('started', _STARTED)
+        feed_server, procs = await start_workers(cfg, workers)
+    else:
+        runner = web.AppRunner(make_app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+    mark_startup('listen')
 
     W = 66
     h = lambda s: f'  ║{s:<{W}}║'
@@ -908,24 +3318,40 @@ async def main(cfg: dict):
     print(f'  ╠{"═"*W}╣')
     print(h(f'  Multi Chat:  http://localhost:{port}/xumbrega_multichat.html'))
     print(h(f'  Overlay:     http://localhost:{port}/xumbrega_overlay_webcam.html'))
-    if cfg['tw']:
-        print(h(f'  Twitch:      #{TW_CH}'))
-    if cfg['ki']:
-        print(h(f'  Kick:        {KI_CH}'))
-    if video_id:
-        print(h(f'  YouTube ID:  {video_id}'))
+    if CHANNELS['tw']:
+        print(h(f'  Twitch:      {", ".join("#" + ch for ch in CHANNELS["tw"].values())}'))
+    if CHANNELS['ki']:
+        print(h(f'  Kick:        {", ".join(CHANNELS["ki"].values())}'))
+    if CHANNELS['yt']:
+        print(h(f'  YouTube ID:  {", ".join(CHANNELS["yt"])}'))
+    if host != DEFAULT_HOST:
+        print(h(f'  Endereço:    {host}:{port}'))
+    if workers:
+        print(h(f'  Workers:     {workers} processos servindo a porta {port}'))
+    if cfg.get('replay'):
+        speed = cfg.get('replay_speed', 1.0)
+        rate = 'sem espera' if speed <= 0 else f'{speed:g}x'
+        print(h(f'  Replay:      {Path(cfg["replay"]).name} ({rate}{", em loop" if cfg.get("replay_loop") else ""})'))
     print(f'  ╠{"═"*W}╣')
     print(h('  Mantenha esta janela aberta durante a live'))
     print(f'  ╚{"═"*W}╝')
     print()
 
-    if cfg['tw']:
-        asyncio.create_task(twitch_loop())
-    if cfg['ki']:
-        asyncio.create_task(kick_loop())
-    if video_id:
-        asyncio.create_task(youtube_loop(video_id))
-    asyncio.create_task(file_watcher_loop())
+    # O event loop só guarda referência fraca das tasks: sem esta lista, uma task parada esperando algo que só
+    # ela referencia (o file watcher) vira lixo de ciclo e o GC a destrói no meio da live
+    background = [asyncio.create_task(file_watcher_loop())]
+    if not workers and history_index is None:
+        background.append(start_history_index())  # com workers, cada worker monta o seu (quem responde /history)
+    if CHANNELS['tw']:
+        background.append(asyncio.create_task(twitch_loop()))
+    if CHANNELS['ki']:
+        background.append(asyncio.create_task(kick_loop()))
+    if CHANNELS['yt']:
+        background.append(asyncio.create_task(youtube_loop(list(CHANNELS['yt']))))
+    if cfg.get('replay'):
+        background.append(asyncio.create_task(
+            replay_loop(Path(cfg['replay']), cfg.get('replay_speed', 1.0), cfg.get('replay_loop', False))))
+    writer_task = asyncio.create_task(history_writer_loop())
 
     stop = asyncio.Event()
     loop = asyncio.get_event_loop()
@@ -937,15 +3363,15 @@ async def main(cfg: dict):
 
     await stop.wait()
 
-    # 1. Para de aceitar novas conexões
-    await site.stop()
+    # 1. Para de aceitar novas conexões (com workers: fecha o canal e espera eles desconectarem os clientes)
+    if workers:
+        await stop_workers(port, feed_server, procs)
+    else:
+        await site.stop()
 
-    # 2. Desconecta todos os clientes SSE via sentinel
-    for q in list(clients):
-        try:
-            q.put_nowait(None)
-        except asyncio.QueueFull:
-            pass
+    # 2. Desconecta todos os clientes SSE
+    for client in list(clients):
+        client.close()
 
     # 3. Aguarda os clientes saírem (até 2s)
     for _ in range(40):
@@ -953,19 +3379,59 @@ async def main(cfg: dict):
             break
         await asyncio.sleep(0.05)
 
-    # 4. Cancela tasks restantes (loops de plataforma, etc.)
-    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    # 4. Cancela as demais tasks (loops de plataforma, replay, etc.) — depois disso nenhuma mensagem nova é salva
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task() and t is not writer_task]
     for t in tasks:
         t.cancel()
     await asyncio.gather(*tasks, return_exceptions=True)
 
-    # 5. Cleanup final
-    await runner.cleanup()
+    # 5. Writer grava o que ainda está na fila (o sentinela entra por último) e fecha o segmento
+    _history_queue.put_nowait(None)
+    try:
+        await asyncio.wait_for(writer_task, timeout=5)
+    except Exception as e:
+        log('hist', 'ERROR', f'writer não finalizou: {type(e).__name__}: {e}')
+
+    # 6. Cleanup final
+    await save_emote_index()
+    await close_http()
+    if runner:
+        await runner.cleanup()
 
 
 if __name__ == '__main__':
+    import argparse
+
+    ap = argparse.ArgumentParser(description='Xumbr3ga Chat Hub')
+    ap.add_argument('--replay', nargs='?', const=str(HISTORY_DIR), metavar='FONTE',
+                    help='re-transmite um histórico (diretório de segmentos ou .jsonl) ou captura IRC '
+                         'no lugar das plataformas (padrão: history/)')
+    ap.add_argument('--speed', type=float, default=1.0, help='velocidade do replay: 1 = original, 4 = 4x, 0 = sem espera')
+    ap.add_argument('--loop', action='store_true', help='recomeça o replay ao chegar no fim')
+    ap.add_argument('--workers', type=int, metavar='N',
+                    help='N processos servindo /events e estáticos na mesma porta (0 = processo único)')
+    ap.add_argument('--headless', action='store_true',
+                    help='sobe sem dialog (config.json + XUMBREGA_* + flags abaixo); implícito com qualquer flag '
+                         'de plataforma ou sem display')
+    ap.add_argument('--tw', metavar='CANAIS', help='canais da Twitch, separados por vírgula ("" desliga)')
+    ap.add_argument('--ki', metavar='CANAIS', help='canais da Kick, separados por vírgula ("" desliga)')
+    ap.add_argument('--ki-id', metavar='IDS', help='chatroom IDs da Kick, na mesma ordem dos canais')
+    ap.add_argument('--yt', metavar='VIDEOS', help='video IDs do YouTube, separados por vírgula ("" desliga)')
+    ap.add_argument('--port', type=int, help='porta HTTP (padrão: config salva ou 8080)')
+    ap.add_argument('--host', help=f'endereço de bind (padrão: {DEFAULT_HOST}; 0.0.0.0 expõe na rede)')
+    args = ap.parse_args()
+    headless = not args.replay and is_headless(args)
+    try:
+        if args.port is not None:
+            args.port = parse_port(args.port)
+        headless_cfg = headless_config(args) if headless else None
+    except ValueError as e:
+        ap.error(str(e))
+
     if not acquire_lock():
         try:
+            if headless:
+                raise RuntimeError('headless')  # nem tenta importar tkinter
             import tkinter as tk
             from tkinter import messagebox
             root = tk.Tk()
@@ -977,10 +3443,23 @@ if __name__ == '__main__':
         sys.exit(1)
 
     try:
-        cfg = ask_startup_config()
+        if args.replay:
+            # Sem dialog e sem plataformas: só a porta vem da config salva
+            cfg = {'tw': False, 'tw_channel': '', 'ki': False, 'ki_channel': '', 'ki_id': '', 'yt': '',
+                   'port': load_config().get('port', 8080),
+                   'replay': args.replay, 'replay_speed': args.speed, 'replay_loop': args.loop}
+        elif headless:
+            cfg = headless_cfg
+            if not (cfg['tw'] or cfg['ki'] or cfg['yt']):
+                cfg = None
+        else:
+            cfg = ask_startup_config()
         if cfg is None:
             print('Nenhuma plataforma selecionada. Encerrando.')
             sys.exit(0)
+        for key in ('workers', 'port', 'host'):
+            if getattr(args, key) is not None:
+                cfg[key] = getattr(args, key)
         asyncio.run(main(cfg))
         print('Servidor encerrado.')
     finally: